@@ -0,0 +1,182 @@
+# benchmark.py
+"""
+Throughput benchmarks of the functions that run per page or per row, on synthetic data.
+
+    python benchmark.py                 Run and compare with the saved baselines
+    python benchmark.py --save          Run and save the results as the new baselines
+    python benchmark.py --quick         Only the small sizes (1k rows, 30 pages)
+
+Exits with status 1 if a case is slower than its baseline by more than --threshold.
+Baselines depend on the machine, save them on the one that runs the comparison.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fitz
+
+from src.drive_upload import build_color_verification_requests
+from src.excel_util import TABLE_COLUMNS, save_table
+from src.image_processing import clean_name_for_comparison, get_contact, get_declarant_contact
+from src.pdf_processing import pdf_to_images
+
+BASELINE_FILE = "./benchmark_baseline.json"
+THRESHOLD = 0.25  # Allowed throughput drop before a case fails
+
+LAST_NAMES = ["DUPONT", "MARTIN", "BERNARD", "THOMAS", "PETIT", "ROBERT", "RICHARD", "DURAND", "LEFÈVRE", "MOREAU"]
+FIRST_NAMES = ["Jean", "Marie", "Pierre", "Françoise", "Michel", "Anne-Sophie", "Jacques", "Hélène", "André", "Élise"]
+STREETS = ["rue de la Paix", "avenue Foch", "boulevard Saint-Michel", "place de l'Église", "chemin des Vignes"]
+CITIES = ["Paris", "Lyon", "Nantes", "Saint-Étienne", "Aix-en-Provence", "Besançon"]
+
+
+def _name(rng):
+    return f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}-{rng.randrange(10000)}"
+
+
+def _address(rng):
+    return f"{rng.randrange(1, 200)} {rng.choice(STREETS)}, {rng.randrange(10000, 99999)} {rng.choice(CITIES)}"
+
+
+def _normalize(text):
+    # The form get_undertaker_data stores the declarants and addresses in
+    return clean_name_for_comparison(text)
+
+
+def make_undertaker_data(rows, rng):
+    return [
+        (_normalize(_name(rng)), _normalize(_address(rng)), f"0{rng.randrange(10**8, 10**9)}", f"contact{i}@example.fr")
+        for i in range(rows)
+    ]
+
+
+def make_table_rows(rows, rng):
+    return [
+        [_name(rng), f"{rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}/2024", _name(rng),
+         rng.choice(CITIES), rng.choice(STREETS), "0612345678", "contact@example.fr", "à envoyer",
+         "https://drive.google.com/file/d/0/view"]
+        for _ in range(rows)
+    ]
+
+
+def make_pdf(path, pages, rng):
+    """Write a PDF of text pages laid out like a death certificate."""
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        lines = [_name(rng), "Acte de décès", f"Décédé le {rng.randrange(1, 29)} mars 2024 à {rng.choice(CITIES)}"]
+        lines += [f"Déclarant : {_name(rng)}, {_address(rng)}"] + ["Lorem ipsum dolor sit amet " * 3] * 20
+        for i, line in enumerate(lines):
+            page.insert_text((60, 70 + i * 24), line, fontsize=11)
+    doc.save(path)
+    doc.close()
+
+
+def measure(fn, units, repeat=5):
+    """Return the best throughput of fn() over repeat runs, in units per second."""
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - t
+        best = seconds if best is None else min(best, seconds)
+    return units / best if best else float("inf")
+
+
+def run_cases(quick, folder):
+    """Run every case and return {case: (throughput, unit)}."""
+    rng = random.Random(0)
+    row_sizes = (1_000,) if quick else (1_000, 100_000)
+    # 100k rows of conditional format requests take about 2 GB
+    color_sizes = (1_000,) if quick else (1_000, 10_000)
+    pdf_pages = 30 if quick else 300
+    results = {}
+
+    def run(case, fn, units, unit, repeat=5):
+        print(f"{case} ...", end=" ", flush=True)
+        results[case] = (measure(fn, units, repeat), unit)
+        print(f"{results[case][0]:,.1f} {unit}/sec")
+
+    names = [_name(rng) for _ in range(100_000)]
+    run("clean_name_for_comparison", lambda: [clean_name_for_comparison(name) for name in names], len(names), "names")
+
+    for rows in row_sizes:
+        data = make_undertaker_data(rows, rng)
+        # Half of the lookups find a row, half scan the whole sheet
+        queries = [_address(rng) for _ in range(50)] + [rng.choice(data)[1] for _ in range(50)]
+        declarants = [_name(rng) for _ in range(50)] + [rng.choice(data)[0] for _ in range(50)]
+        run(f"get_contact[{rows} rows]", lambda: [get_contact(q, data) for q in queries], len(queries), "lookups")
+        run(
+            f"get_declarant_contact[{rows} rows]",
+            lambda: [get_declarant_contact(q, data) for q in declarants], len(declarants), "lookups",
+        )
+
+    for rows in row_sizes:
+        table = make_table_rows(rows, rng)
+        path = os.path.join(folder, f"table-{rows}.xlsx")
+        run(f"save_table[{rows} rows]", lambda: save_table(table, path, TABLE_COLUMNS), rows, "rows")
+
+    for rows in color_sizes:
+        run(
+            f"build_color_verification_requests[{rows} rows]",
+            lambda: build_color_verification_requests(0, rows, ";"), rows, "rows",
+        )
+
+    pdf_path = os.path.join(folder, f"register-{pdf_pages}.pdf")
+    make_pdf(pdf_path, pdf_pages, rng)
+    image_folder = os.path.join(folder, "images")
+    run(
+        f"pdf_to_images[{pdf_pages} pages]",
+        lambda: pdf_to_images(pdf_path, image_folder, 200, 3), pdf_pages, "pages", repeat=1,
+    )
+    return results
+
+
+def compare(results, baselines, threshold):
+    """Print each case against its baseline and return the names of the regressed cases."""
+    regressions = []
+    print()
+    for case, (throughput, unit) in results.items():
+        baseline = baselines.get(case)
+        if baseline is None:
+            print(f"{case} : no baseline")
+            continue
+        change = throughput / baseline - 1
+        status = "REGRESSION" if change < -threshold else "ok"
+        if status != "ok":
+            regressions.append(case)
+        print(f"{case} : {throughput:,.1f} {unit}/sec, baseline {baseline:,.1f} ({change:+.0%}) {status}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the per-page and per-row functions")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baselines")
+    parser.add_argument("--quick", action="store_true", help="Only run the small sizes")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed throughput drop (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Path of the baseline file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_cases(args.quick, folder)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    if args.save:
+        baselines.update({case: throughput for case, (throughput, _) in results.items()})
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2)
+        print(f"\nBaselines saved to {args.baseline}")
+        sys.exit()
+
+    regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions beyond {args.threshold:.0%}")
+        sys.exit(1)
@@ -5,35 +5,64 @@ check_for_updates()
 
 import os
 import time
+import argparse
 import shutil
-import pandas as pd
+from collections import deque
 from tqdm import tqdm
-from googleapiclient.discovery import build
 
-from src.pdf_processing import pdf_to_images
-from src.excel_util import save_table
+from src.pdf_processing import get_page_count, render_pdf
+from src.excel_util import TableSink, TABLE_COLUMNS
 from src.image_processing import *
 from src.utils import *
 from src.constants import *
 from src.drive_upload import *
-from src.undertaker_data import get_uploaded_sheets
+from src.upload_pool import UploadPool
+from src.page_filter import PageFilter
+from src.memory_governor import memory_governor
+from src.preflight import RunStats, plan
+from src.retry import retry_stats
+from src.text_filter import prompt_stats
+from src.image_encoding import encoding_stats
+from src.undertaker_data import get_all_uploaded_sheets
+from src.distributed import run_coordinator, run_worker
+from src.batch_extraction import run_batch
+from src.extraction_backend import EXTRACTION_BACKENDS, set_backend
+from src.backend_benchmark import run_benchmark
 
 
 def main():
     # Authenticate Google Drive once and get the service instances
-    creds = authenticate_google_drive()
-    drive_service = build('drive', 'v3', credentials=creds)
-    sheets_service = build('sheets', 'v4', credentials=creds)
+    session = authenticate_google_drive()
+    drive_service = session.service('drive', 'v3')
+    sheets_service = session.service('sheets', 'v4')
+    # Certificate uploads run in the background on their own pooled clients
+    upload_pool = UploadPool(session, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE)
 
 
     existing_images = get_existing_image_names(sheets_service, IMAGE_SHEET_ID)
+    certificate_index.seed_from_drive(drive_service, DEATH_CERTIFICATES_FOLDER_ID)
 
 
     check_for_tesseract()
 
+    # Blank pages and duplicates of pages seen earlier in the run are skipped before OCR
+    page_filter = PageFilter(BLANK_INK_RATIO, DUPLICATE_HASH_DISTANCE)
+
+    # List the already uploaded sheets once instead of querying Drive for every PDF
+    uploaded_sheets = get_all_uploaded_sheets(drive_service, TARGET_FOLDER_ID)
+
     pdf_files = [
         file for file in os.listdir(INPUT_FOLDER) if file.lower().endswith(".pdf")
     ]
+    # Estimate the run from the previous ones and start with the quickest PDFs.
+    # PDFs with nothing left to do come first and aren't estimated.
+    run_stats = RunStats(RUN_STATS_FILE)
+    done = [
+        pdf for pdf in pdf_files
+        if os.path.exists(f"{OUTPUT_FOLDER}/{pdf.replace('.pdf', '.xlsx')}")
+        or pdf.replace(".pdf", "") in uploaded_sheets
+    ]
+    pdf_files = done + plan([pdf for pdf in pdf_files if pdf not in done], INPUT_FOLDER, run_stats)
 
     for pdf in pdf_files:
         pdf_name = os.path.basename(pdf)
@@ -47,49 +76,55 @@ def main():
 
         time_start = time.time()
         print(f"\nProcess Started For {pdf_name}\n")
-        if pdf_name.replace(".pdf", "") not in get_uploaded_sheets(drive_service, pdf_name, TARGET_FOLDER_ID):
+        if pdf_name.replace(".pdf", "") not in uploaded_sheets:
 
             # Convert PDF to images
-            pdf_to_images(pdf_path, IMAGE_FOLDER, 200, 3)
+            memory_governor.reset_peaks()
+            render_start = time.time()
+            render_pdf(pdf_path, IMAGE_FOLDER, page_filter=page_filter)
+            render_seconds = time.time() - render_start
+            extract_start = time.time()
+            tokens_start = prompt_stats.prompt_tokens
+            upload_start = upload_pool.uploaded_bytes
 
             images = [
                 file for file in os.listdir(IMAGE_FOLDER) if file.lower().endswith(".png")
             ]
             images = sorted(images, key=extract_number)
-            data = []
+            # Rows are written to the Excel file as soon as their certificate is uploaded
+            sink = TableSink(excel_path, TABLE_COLUMNS, OUTPUT_FORMATS)
+            pending = deque()
 
             print("\nSTART :\n")
             progress_bar = tqdm(images, ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}")
             for image in progress_bar:
                 sleep(1)
-                result = process_image(image, drive_service, sheets_service,existing_images)  # Pass services
+                result = process_image(image, upload_pool, existing_images, pdf_name)
                 if result:
-                    data.append(result)
+                    pending.append(result)
+                write_finished_rows(pending, sink)
 
             print()
-            df = pd.DataFrame(data)
-            df.columns = [
-                "Name",
-                "Date Of Death", 
-                "Declarant Name", 
-                "City", 
-                "Street",
-                "Phone",            
-                "Email",
-                "Status",
-                "Image"
-            ]
-            save_table(df, excel_path)
+            # Wait for the remaining certificate uploads of this PDF to finish
+            write_finished_rows(pending, sink, wait=True)
+            sink.close()
+            certificate_index.save()
+            run_stats.add(
+                pages=get_page_count(pdf_path),
+                processed_pages=len(images),
+                render_seconds=render_seconds,
+                extract_seconds=time.time() - extract_start,
+                prompt_tokens=prompt_stats.prompt_tokens - tokens_start,
+                upload_bytes=upload_pool.uploaded_bytes - upload_start,
+            )
+            upload_pool.report()
+            encoding_stats.report(upload_pool)
+            prompt_stats.report()
+            memory_governor.report()
         
             # Upload Excel to Google Drive and convert it to Google Sheet
-            upload_to_drive(drive_service, pdf_path, TARGET_FOLDER_ID)
-            excel_drive_id = upload_to_drive(drive_service, excel_path, TARGET_FOLDER_ID)
-
-            sheet_id = convert_excel_to_google_sheet(drive_service, excel_drive_id)
-            
-            apply_sheet_customizations(sheets_service, sheet_id, 7)
-            # After conversion, delete the Excel file from Google Drive
-            delete_file_from_drive(drive_service, excel_drive_id)
+            publish_table(drive_service, sheets_service, pdf_path, excel_path, TARGET_FOLDER_ID)
+            uploaded_sheets.add(pdf_name.replace(".pdf", ""))
         else:
             print('Already uploaded')
            # Move the processed PDF file to the completed folder
@@ -97,11 +132,29 @@ def main():
         
         print(f"Completed processing for {pdf_name} in {int(time.time() - time_start)} sec")
 
+    upload_pool.close()
+    certificate_index.report()
+    retry_stats.report()
     print("\n\nAll Files Completed")
     countdown("Exit", 3)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--coordinator", action="store_true", help="Queue the input PDFs for workers and finalize them when done")
+    parser.add_argument("--worker", action="store_true", help="Process page jobs from the queue")
+    parser.add_argument("--queue", default=QUEUE_FILE, help="Path of the shared queue file")
+    parser.add_argument("--batch", action="store_true", help="Extract all the input PDFs with OpenAI Batch API jobs")
+    parser.add_argument("--backend", choices=list(EXTRACTION_BACKENDS), default=EXTRACTION_BACKEND, help="How the fields are read from the OCR text")
+    parser.add_argument("--plan", action="store_true", help="Print the pre-flight estimates of the input PDFs and exit")
+    parser.add_argument("--benchmark", metavar="SAMPLES", nargs="?", const=BENCHMARK_SAMPLES_FILE, help="Compare the extraction backends on a labelled JSONL sample set (default: the bundled one) and exit")
+    args = parser.parse_args()
+    set_backend(args.backend)
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        sys.exit()
+
     if not os.path.exists(INPUT_FOLDER):
         os.makedirs(INPUT_FOLDER)
     if not os.path.exists(OUTPUT_FOLDER):
@@ -110,4 +163,14 @@ if __name__ == "__main__":
         os.makedirs(IMAGE_FOLDER)
     if not os.path.exists(COMPLETED_FOLDER):
         os.makedirs(COMPLETED_FOLDER)
-    main()
\ No newline at end of file
+    if args.plan:
+        pdf_files = [file for file in os.listdir(INPUT_FOLDER) if file.lower().endswith(".pdf")]
+        plan(pdf_files, INPUT_FOLDER, RunStats(RUN_STATS_FILE))
+    elif args.coordinator:
+        run_coordinator(args.queue)
+    elif args.worker:
+        run_worker(args.queue)
+    elif args.batch:
+        run_batch()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+# backend_benchmark.py
+
+import json
+import os
+import re
+import time
+
+from unidecode import unidecode
+
+from .extraction_backend import EXTRACTION_BACKENDS
+from .image_processing import ocr_image
+from .prompt_template import RESULT_FIELDS
+
+
+def _normalize(value):
+    """Compare fields regardless of case, accents, spaces and punctuation."""
+    return re.sub(r"[^a-z0-9]", "", unidecode(value or "").lower())
+
+
+def load_samples(sample_path):
+    """
+    Read the labelled sample set: one JSON object per line with the expected "fields"
+    (RESULT_FIELDS -> value) and either the OCR "text" or the "image" of the page
+    (relative to the sample file). Images are OCRed once, before timing the backends.
+    """
+    folder = os.path.dirname(os.path.abspath(sample_path))
+    samples = []
+    with open(sample_path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            text = sample.get("text")
+            if text is None:
+                text = ocr_image(os.path.join(folder, sample["image"]))
+            samples.append((text, sample["fields"]))
+    return samples
+
+
+def run_benchmark(sample_path, backend_names=None):
+    """
+    Extract every sample page with each backend and print its pages/second and the
+    share of correct fields (overall and per field).
+
+    :return: {backend name: (pages per second, overall accuracy)}
+    """
+    samples = load_samples(sample_path)
+    if not samples:
+        print(f"No samples in {sample_path}")
+        return {}
+    print(f"{len(samples)} labelled pages\n")
+
+    summary = {}
+    for name in backend_names or EXTRACTION_BACKENDS:
+        backend = EXTRACTION_BACKENDS[name]()
+        correct = dict.fromkeys(RESULT_FIELDS, 0)
+        errors = 0
+        t = time.perf_counter()
+        for text, expected in samples:
+            try:
+                result = backend.extract(text)
+            except Exception as e:
+                print(f"{name} : {e}")
+                errors += 1
+                continue
+            for field in RESULT_FIELDS:
+                if _normalize(result.get(field)) == _normalize(expected.get(field)):
+                    correct[field] += 1
+        seconds = time.perf_counter() - t
+
+        pages_per_second = len(samples) / seconds if seconds else float("inf")
+        accuracy = sum(correct.values()) / (len(samples) * len(RESULT_FIELDS))
+        summary[name] = (pages_per_second, accuracy)
+        print(f"{name} : {pages_per_second:.2f} pages/sec, {accuracy:.0%} fields correct, {errors} errors")
+        for field in RESULT_FIELDS:
+            print(f"    {field} : {correct[field] / len(samples):.0%}")
+    return summary
@@ -0,0 +1,318 @@
+# batch_extraction.py
+
+import json
+import os
+import shutil
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+from .constants import *
+from .drive_upload import authenticate_google_drive, publish_table
+from .excel_util import TableSink, TABLE_COLUMNS
+from .image_encoding import encoding_stats
+from .extraction_backend import build_request, estimate_prompt_tokens, estimate_raw_prompt_tokens, openai_client
+from .image_processing import (
+    certificate_index,
+    check_for_tesseract,
+    complete_fields,
+    get_existing_image_names,
+    log_prompt,
+    ocr_image,
+    upload_image_and_append_sheet,
+    write_finished_rows,
+)
+from .page_filter import PageFilter
+from .pdf_processing import render_pdf
+from .prompt_template import PROMPT_VERSION, get_cached_tokens, parse_result
+from .retry import retry_stats
+from .text_filter import prompt_stats
+from .undertaker_data import get_all_uploaded_sheets
+from .upload_pool import UploadPool
+from .utils import countdown, extract_number
+
+BATCH_FOLDER = f"{IMAGE_FOLDER}/batch"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def _image_folder(pdf):
+    return f"{BATCH_FOLDER}/{pdf.replace('.pdf', '')}"
+
+
+def _save_state(state):
+    with open(BATCH_STATE_FILE, "w", encoding="utf-8") as file:
+        json.dump(state, file)
+
+
+def _prepare_batch(pdf_files):
+    """
+    Render and OCR every page of the PDFs and write one chat completion request per page,
+    split into request files under the limits of a batch (BATCH_MAX_REQUESTS requests
+    and BATCH_MAX_MB).
+
+    :return: The batches to submit, as {"requests": file path, "pdfs": the PDFs with pages
+        in it, "batch_id": None}, and the estimated prompt tokens per request, without and
+        with condensing the text.
+    """
+    page_filter = PageFilter(BLANK_INK_RATIO, DUPLICATE_HASH_DISTANCE)
+    max_bytes = BATCH_MAX_MB * 1024 * 1024
+    tokens_before = {}
+    tokens_after = {}
+    batches = []
+    requests_file = None
+    requests, size = 0, 0
+    os.makedirs(BATCH_FOLDER, exist_ok=True)
+
+    try:
+        for pdf in pdf_files:
+            print(f"\nOCR : {pdf}")
+            image_folder = _image_folder(pdf)
+            render_pdf(f"{INPUT_FOLDER}/{pdf}", image_folder, page_filter=page_filter)
+            images = [file for file in os.listdir(image_folder) if file.lower().endswith(".png")]
+            for image in tqdm(sorted(images, key=extract_number), ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"):
+                text = ocr_image(f"{image_folder}/{image}")
+                custom_id = f"{pdf}/{image}"
+                request = build_request(text)
+                tokens_before[custom_id] = estimate_raw_prompt_tokens(text)
+                tokens_after[custom_id] = estimate_prompt_tokens(request)
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": request,
+                }
+                line = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                if requests_file is None or requests >= BATCH_MAX_REQUESTS or size + len(line) > max_bytes:
+                    if requests_file is not None:
+                        requests_file.close()
+                    requests_path = f"{BATCH_FOLDER}/requests-{len(batches) + 1}.jsonl"
+                    requests_file = open(requests_path, "wb")
+                    batches.append({"requests": requests_path, "pdfs": [], "batch_id": None})
+                    requests, size = 0, 0
+                requests_file.write(line)
+                requests += 1
+                size += len(line)
+                if pdf not in batches[-1]["pdfs"]:
+                    batches[-1]["pdfs"].append(pdf)
+    finally:
+        if requests_file is not None:
+            requests_file.close()
+    return batches, tokens_before, tokens_after
+
+
+def _submit_batches(state):
+    """Submit the request files of the state that have no batch yet, saving each batch id as it is created."""
+    for i, batch_state in enumerate(state["batches"], 1):
+        if batch_state["batch_id"]:
+            continue
+        with open(batch_state["requests"], "rb") as requests_file:
+            input_file = openai_client.files.create(file=requests_file, purpose="batch")
+        batch = openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        batch_state["batch_id"] = batch.id
+        _save_state(state)
+        print(f"Submitted batch {batch.id} ({i}/{len(state['batches'])})")
+
+
+def _pdf_status(pdf, state, statuses):
+    """
+    Return "completed" once all the batches with pages of the PDF have completed, "failed"
+    if one of them ended otherwise, or None while some are still waited for.
+    """
+    pdf_statuses = [statuses.get(batch["batch_id"]) for batch in state["batches"] if pdf in batch["pdfs"]]
+    if any(status not in (None, "completed") for status in pdf_statuses):
+        return "failed"
+    if None in pdf_statuses:
+        return None
+    return "completed"
+
+
+def _wait_for_batch(batch_id):
+    """Poll the batch until it ends and return it."""
+    while True:
+        batch = openai_client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        print(f"Batch {batch.status} : {counts.completed}/{counts.total} done, {counts.failed} failed")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        time.sleep(BATCH_POLL_SECONDS)
+
+
+def _read_batch_results(batch, tokens_before, tokens_after, prompt_version):
+    """Return the model's answer for each custom_id of the batch, logging the prompt sizes of each page."""
+    results = {}
+    if not batch.output_file_id:
+        return results
+    for line in openai_client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            print(f"{item['custom_id']} : {item.get('error') or response.get('body')}")
+            continue
+        body = response["body"]
+        results[item["custom_id"]] = body["choices"][0]["message"]["content"]
+        prompt_stats.add(
+            tokens_before.get(item["custom_id"], 0),
+            tokens_after.get(item["custom_id"], 0),
+            body["usage"]["prompt_tokens"],
+            get_cached_tokens(body["usage"]),
+        )
+        pdf, image = item["custom_id"].split("/", 1)
+        log_prompt(pdf, extract_number(image), prompt_version)
+    return results
+
+
+def _finalize_pdf(pdf, results, drive_service, sheets_service, upload_pool, existing_images):
+    """
+    Write the table of a PDF from the batch answers, upload its certificates and publish it.
+
+    :return: False if some pages have no answer: the PDF is left in the input folder for the next batch.
+    """
+    pdf_path = f"{INPUT_FOLDER}/{pdf}"
+    excel_path = pdf_path.replace(".pdf", ".xlsx").replace(INPUT_FOLDER, OUTPUT_FOLDER)
+    image_folder = _image_folder(pdf)
+    images = [file for file in os.listdir(image_folder) if file.lower().endswith(".png")]
+    missing = [image for image in images if f"{pdf}/{image}" not in results]
+    if missing:
+        print(f"\n{pdf} : no answer for {len(missing)} of {len(images)} pages, left in {INPUT_FOLDER} for the next batch")
+        shutil.rmtree(image_folder, ignore_errors=True)
+        return False
+    print(f"\nFinalizing {pdf}\n")
+
+    sink = TableSink(excel_path, TABLE_COLUMNS, OUTPUT_FORMATS)
+    pending = deque()
+    for image in sorted(images, key=extract_number):
+        content = results[f"{pdf}/{image}"]
+        try:
+            fields = complete_fields(parse_result(content))
+            file_link = upload_image_and_append_sheet(
+                fields[0], f"{image_folder}/{image}", upload_pool, existing_images
+            )
+            pending.append(fields + ["à envoyer", file_link])
+        except Exception as e:
+            print(e)
+        write_finished_rows(pending, sink)
+    write_finished_rows(pending, sink, wait=True)
+    sink.close()
+    certificate_index.save()
+    upload_pool.report()
+    encoding_stats.report(upload_pool)
+
+    publish_table(drive_service, sheets_service, pdf_path, excel_path, TARGET_FOLDER_ID)
+    shutil.move(pdf_path, f"{COMPLETED_FOLDER}/{pdf}")
+    shutil.rmtree(image_folder, ignore_errors=True)
+    return True
+
+
+def run_batch():
+    """
+    Backlog mode: OCR all the input PDFs, extract their fields with OpenAI Batch API
+    jobs (half price, separate rate limits, results within 24 hours), then write and
+    publish the tables as main() does.
+
+    The requests are split into as many batches as the Batch API limits require, and
+    each PDF is finalized once all the batches with its pages have completed. The
+    batches are saved in BATCH_STATE_FILE as soon as the pages are OCRed, so running
+    again after an interruption submits the missing ones and resumes waiting instead
+    of starting over.
+    """
+    session = authenticate_google_drive()
+    drive_service = session.service('drive', 'v3')
+    sheets_service = session.service('sheets', 'v4')
+
+    if os.path.exists(BATCH_STATE_FILE):
+        with open(BATCH_STATE_FILE, encoding="utf-8") as file:
+            state = json.load(file)
+        if "batch_id" in state:
+            # State of a single batch, written before the requests were split
+            state["batches"] = [{"requests": None, "pdfs": list(state["pdfs"]), "batch_id": state.pop("batch_id")}]
+        print(f"Resuming {len(state['batches'])} batches")
+        if state.get("prompt_version") != PROMPT_VERSION:
+            print(f"The batches were built with prompt version {state.get('prompt_version')}, not {PROMPT_VERSION}")
+    else:
+        check_for_tesseract()
+        uploaded_sheets = get_all_uploaded_sheets(drive_service, TARGET_FOLDER_ID)
+        pdf_files = []
+        for pdf in os.listdir(INPUT_FOLDER):
+            if not pdf.lower().endswith(".pdf"):
+                continue
+            excel_path = f"{INPUT_FOLDER}/{pdf}".replace(".pdf", ".xlsx").replace(INPUT_FOLDER, OUTPUT_FOLDER)
+            if os.path.exists(excel_path):
+                print(f"Skipping {pdf}, corresponding Excel file already exists locally.")
+            elif pdf.replace(".pdf", "") in uploaded_sheets:
+                print(f"{pdf} : Already uploaded")
+                shutil.move(f"{INPUT_FOLDER}/{pdf}", f"{COMPLETED_FOLDER}/{pdf}")
+            else:
+                pdf_files.append(pdf)
+        if not pdf_files:
+            print("\nNothing to process")
+            return
+
+        batches, tokens_before, tokens_after = _prepare_batch(pdf_files)
+        state = {
+            "batches": batches,
+            "pdfs": pdf_files,
+            "prompt_version": PROMPT_VERSION,
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+        }
+        _save_state(state)
+        print(f"\n{len(tokens_before)} pages in {len(batches)} batches")
+    _submit_batches(state)
+
+    upload_pool = UploadPool(session, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE)
+    existing_images = get_existing_image_names(sheets_service, IMAGE_SHEET_ID)
+    certificate_index.seed_from_drive(drive_service, DEATH_CERTIFICATES_FOLDER_ID)
+    statuses = {}  # batch id -> final status
+    results = {}
+
+    def finalize_ready_pdfs():
+        """Finalize the PDFs whose batches have all completed, and return how many were left incomplete."""
+        incomplete = 0
+        for pdf in list(state["pdfs"]):
+            if _pdf_status(pdf, state, statuses) != "completed":
+                continue
+            # A PDF finalized before an interruption is gone from the input folder
+            if os.path.exists(f"{INPUT_FOLDER}/{pdf}") and os.path.exists(_image_folder(pdf)):
+                if not _finalize_pdf(pdf, results, drive_service, sheets_service, upload_pool, existing_images):
+                    incomplete += 1
+            state["pdfs"].remove(pdf)
+            _save_state(state)
+        return incomplete
+
+    # PDFs without a page to extract don't wait for any batch
+    incomplete = finalize_ready_pdfs()
+    for batch_state in state["batches"]:
+        batch = _wait_for_batch(batch_state["batch_id"])
+        statuses[batch.id] = batch.status
+        if batch.status == "completed":
+            results.update(_read_batch_results(
+                batch, state["tokens_before"], state.get("tokens_after", {}), state.get("prompt_version")
+            ))
+            prompt_stats.report()
+        else:
+            print(f"\nBatch {batch.id} {batch.status}, its PDFs stay in {INPUT_FOLDER}")
+        incomplete += finalize_ready_pdfs()
+    upload_pool.close()
+
+    certificate_index.report()
+    retry_stats.report()
+    if state["pdfs"]:
+        # The PDFs of the batches that failed, expired or were cancelled keep their state
+        print(f"\n\n{len(state['pdfs'])} PDFs have a batch that didn't complete, delete {BATCH_STATE_FILE} to submit them again")
+    else:
+        os.remove(BATCH_STATE_FILE)
+        for batch_state in state["batches"]:
+            if batch_state["requests"] and os.path.exists(batch_state["requests"]):
+                os.remove(batch_state["requests"])
+    if incomplete:
+        print(f"\n\n{incomplete} PDFs left in {INPUT_FOLDER}, run again to submit them")
+    elif not state["pdfs"]:
+        print("\n\nAll Files Completed")
+    countdown("Exit", 3)
@@ -0,0 +1,130 @@
+# certificate_index.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from .utils import execute_with_retry
+
+
+class CertificateIndex:
+    """
+    Persistent index of the uploaded death certificates by content hash (md5 -> webViewLink).
+
+    It is seeded from the md5Checksum that Drive keeps for every file, so an image that
+    is already in the folder is recognised whatever name it was uploaded under. The index
+    is kept between runs, and each run only lists the files created since the last seeding.
+    Every full_listing_days the whole folder is listed again and the index rebuilt from
+    it, so the certificates trashed or deleted in Drive are forgotten.
+
+    New uploads are saved to the file by save(), once per PDF.
+    """
+
+    def __init__(self, path, full_listing_days=7):
+        self.path = path
+        self.full_listing_seconds = full_listing_days * 24 * 3600
+        self._lock = threading.Lock()
+        self.links = {}  # md5 -> link, or Future of the link while the upload is in flight
+        self.seeded_at = None  # Drive time (RFC 3339) of the last listing of the folder
+        self.listed_all_at = None  # Local time of the last full listing
+        self.unsaved = False
+        self.hits = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                saved = json.load(file)
+            self.links = saved.get("links", {})
+            self.seeded_at = saved.get("seeded_at")
+            self.listed_all_at = saved.get("listed_all_at")
+
+    @staticmethod
+    def checksum(data: bytes):
+        return hashlib.md5(data).hexdigest()
+
+    def seed_from_drive(self, drive_service, folder_id):
+        """
+        Add the checksums and links of the files created in the Drive folder since the
+        previous seeding to the index, or rebuild it from all the files of the folder
+        the first time and every full_listing_days.
+        """
+        full_listing = (
+            not self.seeded_at or self.listed_all_at is None
+            or time.time() - self.listed_all_at >= self.full_listing_seconds
+        )
+        query = f"'{folder_id}' in parents and trashed = false"
+        if not full_listing:
+            query += f" and createdTime > '{self.seeded_at}'"
+        # Files created during the listing, or hidden by a skewed local clock, are listed
+        # again next time rather than missed
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 3600))
+        links = {}
+        page_token = None
+        while True:
+            request = drive_service.files().list(
+                q=query,
+                fields="nextPageToken, files(md5Checksum, webViewLink)",
+                pageSize=1000,
+                pageToken=page_token,
+            )
+            results = execute_with_retry(request)
+            for file in results.get("files", []):
+                if file.get("md5Checksum"):
+                    links[file["md5Checksum"]] = file["webViewLink"]
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+        with self._lock:
+            if full_listing:
+                # Only the uploads in flight are kept, the links of removed files are dropped
+                in_flight = {checksum: link for checksum, link in self.links.items() if isinstance(link, Future)}
+                self.links = {**links, **in_flight}
+                self.listed_all_at = time.time()
+            else:
+                self.links.update(links)
+            self.seeded_at = started_at
+            self._save()
+
+    def get(self, checksum):
+        """Return the link (or pending Future) of an already uploaded image, or None."""
+        with self._lock:
+            link = self.links.get(checksum)
+            if link is not None:
+                self.hits += 1
+            return link
+
+    def add_pending(self, checksum, future: Future):
+        """Register an upload in flight, so identical images queued meanwhile reuse it."""
+        with self._lock:
+            # The upload may already have finished and stored its link
+            self.links.setdefault(checksum, future)
+
+        def forget_failed(done):
+            if done.exception():
+                with self._lock:
+                    if self.links.get(checksum) is done:
+                        del self.links[checksum]
+
+        future.add_done_callback(forget_failed)
+
+    def add(self, checksum, link):
+        with self._lock:
+            self.links[checksum] = link
+            self.unsaved = True
+
+    def save(self):
+        """Write the uploads added since the last save to the index file."""
+        with self._lock:
+            if self.unsaved:
+                self._save()
+
+    def report(self):
+        if self.hits:
+            print(f"Certificates reused by content hash : {self.hits}")
+
+    def _save(self):
+        links = {checksum: link for checksum, link in self.links.items() if isinstance(link, str)}
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"seeded_at": self.seeded_at, "listed_all_at": self.listed_all_at, "links": links}, file)
+        self.unsaved = False
@@ -9,6 +9,7 @@ load_dotenv(dotenv_path=resource_path(".env"))
 
 
 GPT_KEY = os.environ["GPT_KEY"]
+GPT_BASE_URL = os.environ.get("GPT_BASE_URL")  # Optional, another OpenAI compatible server
 CREDS_JSON = json.loads(os.environ["CREDS_JSON"])
 UNDERTAKER_SHEET_KEY = "12xP7d6R-lhoT39z2b4Jk2Ap07bP_nN6m1j2UXMHaVuk"
 DEATH_CERTIFICATES_FOLDER_ID = '16r80-Mq5jDo6Lj9svu0hD7ULYMyyUnHp'
@@ -18,4 +19,34 @@ INPUT_FOLDER = "./Input"
 OUTPUT_FOLDER = "./Output"
 IMAGE_FOLDER = "./images"
 COMPLETED_FOLDER = "./Completed"
-TOKEN_FILE = 'token.pickle'
\ No newline at end of file
+TOKEN_FILE = 'token.pickle'
+MEMORY_BUDGET_MB = 1024  # Rendering waits while the rendered pages and queued uploads, or the process, use more
+UPLOAD_WORKERS = 4
+UPLOAD_QUEUE_SIZE = 16
+UPLOAD_RETRIES = 10  # Attempts per certificate upload, they also wait while Drive's circuit breaker is open
+UPLOAD_IMAGE_FORMAT = "gray"  # Certificate copy uploaded to Drive: png, gray, bilevel, jpeg or webp
+UPLOAD_TARGET_KB = 300  # Target size of the jpeg and webp certificate copies
+OUTPUT_FORMATS = ()  # Extra copies of the output table next to the Excel file: "csv", "parquet"
+QUEUE_FILE = "./queue.sqlite3"  # Job queue shared by the coordinator and the workers
+JOB_PAGES = 10  # Pages per worker job
+LEASE_SECONDS = 300  # A job is handed to another worker if its worker is silent this long
+MAX_JOB_ATTEMPTS = 3
+QUEUE_POLL_SECONDS = 10
+PAGE_LOG_FILE = "./page_log.csv"  # Per-page events: skipped pages, chosen resolutions, ...
+BLANK_INK_RATIO = 0.0005  # Pages with less of their area covered by ink are skipped as blank (3 short lines ~ 0.002)
+DUPLICATE_HASH_DISTANCE = None  # Max differing bits (of 256) for a rescan to be skipped. Pages on the same form are close too, so off by default
+EXTRACTION_BACKEND = "openai"  # Reads the fields from the OCR text: "openai", or "rules" to run locally without the API
+BENCHMARK_SAMPLES_FILE = "./extraction_samples.jsonl"  # Labelled pages the backends are compared on with --benchmark
+PROMPT_TOKEN_BUDGET = 500  # Max OCR text tokens sent to the model per page
+BATCH_STATE_FILE = "./batch_state.json"  # The submitted batches, so an interrupted run can resume
+BATCH_MAX_REQUESTS = 50_000  # Batch API limit of requests per batch
+BATCH_MAX_MB = 190  # Request file size per batch, under the Batch API limit of 200 MB
+BATCH_POLL_SECONDS = 60
+RUN_STATS_FILE = "./run_stats.json"  # Per-stage totals of previous runs, for the pre-flight estimates
+PREFLIGHT_DPI = 72  # Resolution of the quick blank page check before a run
+PREFLIGHT_SAMPLE_PAGES = 20  # Pages checked per PDF, spread over it
+CERTIFICATE_INDEX_FILE = "./certificate_index.json"  # md5 -> link of the uploaded certificates
+CERTIFICATE_INDEX_FULL_LISTING_DAYS = 7  # The index is rebuilt from the whole Drive folder this often, to drop deleted files
+PROGRESSIVE_OCR = True  # OCR at a low resolution first, re-render only the pages Tesseract isn't sure about
+OCR_STEPS = [(150, 3), (200, 3), (300, 2)]  # (DPI, contrast factor) tried in order
+OCR_MIN_CONFIDENCE = 80  # Mean Tesseract word confidence (0-100) that stops the steps
@@ -0,0 +1,191 @@
+# distributed.py
+
+import os
+import shutil
+import socket
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+from .constants import *
+from .drive_upload import authenticate_google_drive, publish_table
+from .excel_util import TableSink, TABLE_COLUMNS
+from .image_encoding import encode_for_upload
+from .image_processing import (
+    certificate_index,
+    check_for_tesseract,
+    extract_page,
+    get_existing_image_names,
+    log_prompt,
+    upload_image_and_append_sheet,
+    write_finished_rows,
+)
+from .job_queue import JobQueue
+from .memory_governor import memory_governor
+from .page_filter import PageFilter
+from .retry import retry_stats
+from .pdf_processing import get_page_count, render_pdf
+from .undertaker_data import get_all_uploaded_sheets
+from .upload_pool import UploadPool
+from .utils import countdown, extract_number
+
+
+class _LeaseLost(Exception):
+    """Raised from the render callback to stop a job given to another worker."""
+
+
+def _process_job(queue, job_id, worker, pdf_path, pages, image_folder, page_filter):
+    """
+    Render, OCR and extract the pages of one job, renewing the lease after every page.
+
+    :return: A list of (page, fields, encoded) tuples, or None if the lease was lost.
+    """
+    def renew_lease():
+        if not queue.renew(job_id, worker):
+            raise _LeaseLost()
+
+    # Progressive OCR can run Tesseract several times per page, longer than a lease
+    try:
+        render_pdf(pdf_path, image_folder, pages, page_filter, on_page=renew_lease)
+    except _LeaseLost:
+        return None
+    images = [file for file in os.listdir(image_folder) if file.lower().endswith(".png")]
+    images = sorted(images, key=extract_number)
+
+    results = []
+    progress_bar = tqdm(images, ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}")
+    for image in progress_bar:
+        time.sleep(1)
+        image_path = f"{image_folder}/{image}"
+        try:
+            fields = extract_page(image_path)
+            log_prompt(os.path.basename(pdf_path), extract_number(image))
+            encoded = encode_for_upload(image_path, UPLOAD_IMAGE_FORMAT, UPLOAD_TARGET_KB)
+            results.append((extract_number(image), fields, encoded))
+        except Exception as e:
+            # Like process_image, a page that can't be read is left out of the table
+            print(e)
+        if not queue.renew(job_id, worker):
+            return None
+    return results
+
+
+def run_worker(queue_path):
+    """Claim page jobs from the queue, extract their pages and post the results back, until stopped."""
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    image_folder = f"{IMAGE_FOLDER}/{worker}"
+    queue = JobQueue(queue_path, LEASE_SECONDS, MAX_JOB_ATTEMPTS)
+    # Duplicates are detected among the pages this worker has seen
+    page_filter = PageFilter(BLANK_INK_RATIO, DUPLICATE_HASH_DISTANCE)
+    check_for_tesseract()
+    print(f"Worker {worker} started on {queue_path}")
+
+    waiting = False
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            if not waiting:
+                print("\nWaiting for jobs...")
+                waiting = True
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+        waiting = False
+
+        job_id, pdf, first_page, last_page = job
+        print(f"\nPages {first_page + 1}-{last_page} of {pdf}")
+        memory_governor.reset_peaks()
+        try:
+            results = _process_job(
+                queue, job_id, worker, queue.pdf_path(pdf), range(first_page, last_page), image_folder, page_filter
+            )
+        except Exception as e:
+            print(e)
+            queue.release(job_id, worker, e)
+            continue
+        if results is None or not queue.complete(job_id, worker, results):
+            print("Lease expired, the job was given to another worker")
+        memory_governor.report()
+
+
+def _finalize_pdf(queue, pdf, drive_service, sheets_service, upload_pool, existing_images):
+    """Upload the certificates of a fully extracted PDF, write its table and publish it."""
+    pdf_path = f"{INPUT_FOLDER}/{pdf}"
+    excel_path = pdf_path.replace(".pdf", ".xlsx").replace(INPUT_FOLDER, OUTPUT_FOLDER)
+    time_start = time.time()
+    print(f"\nFinalizing {pdf}\n")
+    memory_governor.reset_peaks()
+
+    sink = TableSink(excel_path, TABLE_COLUMNS, OUTPUT_FORMATS)
+    pending = deque()
+    for page, fields, encoded in queue.results(pdf_path):
+        try:
+            file_link = upload_image_and_append_sheet(
+                fields[0], None, upload_pool, existing_images, encoded
+            )
+            pending.append(fields + ["à envoyer", file_link])
+        except Exception as e:
+            print(e)
+        write_finished_rows(pending, sink)
+    write_finished_rows(pending, sink, wait=True)
+    sink.close()
+    certificate_index.save()
+    upload_pool.report()
+    memory_governor.report()
+
+    publish_table(drive_service, sheets_service, pdf_path, excel_path, TARGET_FOLDER_ID)
+    queue.remove_pdf(pdf_path)
+    shutil.move(pdf_path, f"{COMPLETED_FOLDER}/{pdf}")
+    print(f"Completed processing for {pdf} in {int(time.time() - time_start)} sec")
+
+
+def run_coordinator(queue_path):
+    """
+    Queue every input PDF as page-range jobs for the workers, then finalize each PDF
+    (table, Drive upload, sheet customization) as soon as all its jobs are done.
+    """
+    session = authenticate_google_drive()
+    drive_service = session.service('drive', 'v3')
+    sheets_service = session.service('sheets', 'v4')
+    upload_pool = UploadPool(session, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE)
+    existing_images = get_existing_image_names(sheets_service, IMAGE_SHEET_ID)
+    certificate_index.seed_from_drive(drive_service, DEATH_CERTIFICATES_FOLDER_ID)
+    uploaded_sheets = get_all_uploaded_sheets(drive_service, TARGET_FOLDER_ID)
+    queue = JobQueue(queue_path, LEASE_SECONDS, MAX_JOB_ATTEMPTS)
+
+    pdf_files = [
+        file for file in os.listdir(INPUT_FOLDER) if file.lower().endswith(".pdf")
+    ]
+    remaining = []
+    for pdf in pdf_files:
+        pdf_path = f"{INPUT_FOLDER}/{pdf}"
+        excel_path = pdf_path.replace(".pdf", ".xlsx").replace(INPUT_FOLDER, OUTPUT_FOLDER)
+        if os.path.exists(excel_path):
+            print(f"Skipping {pdf}, corresponding Excel file already exists locally.")
+            continue
+        if pdf.replace(".pdf", "") in uploaded_sheets:
+            print(f"{pdf} : Already uploaded")
+            shutil.move(pdf_path, f"{COMPLETED_FOLDER}/{pdf}")
+            continue
+        queue.add_pdf(pdf_path, get_page_count(pdf_path), JOB_PAGES)
+        remaining.append(pdf)
+
+    print(f"\n{len(remaining)} PDFs queued, start the workers with : main.py --worker --queue {queue_path}")
+    while remaining:
+        for pdf in list(remaining):
+            total, done, failed = queue.progress(f"{INPUT_FOLDER}/{pdf}")
+            if done + failed < total:
+                continue
+            remaining.remove(pdf)
+            if failed:
+                print(f"\n{failed} of {total} jobs failed for {pdf}, run the coordinator again to retry them")
+                continue
+            _finalize_pdf(queue, pdf, drive_service, sheets_service, upload_pool, existing_images)
+        if remaining:
+            time.sleep(QUEUE_POLL_SECONDS)
+
+    upload_pool.close()
+    certificate_index.report()
+    retry_stats.report()
+    print("\n\nAll Files Completed")
+    countdown("Exit", 3)
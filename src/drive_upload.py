@@ -5,8 +5,8 @@ import pickle
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.http import MediaFileUpload
-import requests
 
+from .google_session import GoogleSession, set_session
 from .utils import execute_with_retry
 from .constants import CREDS_JSON, TOKEN_FILE
 
@@ -17,11 +17,10 @@ SCOPES = [
 ]
 
 
-def get_user_profile(creds):
+def get_user_profile(session):
     """Retrieve the user's profile information including their name."""
     profile_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
-    headers = {"Authorization": f"Bearer {creds.token}"}
-    response = requests.get(profile_info_url, headers=headers)
+    response = session.get(profile_info_url)
 
     if response.status_code == 200:
         user_info = response.json()
@@ -32,7 +31,7 @@ def get_user_profile(creds):
 
 
 def authenticate_google_drive():
-    """Authenticate and return the Google Drive service instance with refresh token support."""
+    """Authenticate and return the shared GoogleSession used by every Google call, with refresh token support."""
     creds = None
 
     # Load token from file if it exists
@@ -52,7 +51,8 @@ def authenticate_google_drive():
     # Check if the credentials are valid or can be refreshed
     if creds and creds.valid:
         # Get the current user email from the creds
-        current_user = get_user_profile(creds)
+        session = GoogleSession(creds)
+        current_user = get_user_profile(session)
         print(f"Current logged-in user: {current_user}")
 
         # Ask the user if they want to use the current account or log in with a different one
@@ -60,7 +60,8 @@ def authenticate_google_drive():
             input("Do you want to use the current account? (y/n): ").strip().lower()
         )
         if choice != "n":
-            return creds  # Return the current credentials if the user chooses "current"
+            set_session(session)
+            return session  # Return the current credentials if the user chooses "current"
 
     # If no valid credentials, run OAuth flow to get new credentials
     print("No valid credentials found. Please log in.")
@@ -71,7 +72,9 @@ def authenticate_google_drive():
     with open(TOKEN_FILE, "wb") as token:
         pickle.dump(creds, token)
 
-    return creds
+    session = GoogleSession(creds)
+    set_session(session)
+    return session
 
 
 def upload_to_drive(service, file_path, folder_id):
@@ -237,15 +240,14 @@ def apply_conditional_formatting(
     execute_with_retry(request)
 
 
-def apply_cell_color_verification(sheets_service, spreadsheet_id, sheet_id, rows, separator=","):
+def build_color_verification_requests(sheet_id, rows, separator=","):
     """
-    1. If a cell is empty, turn it red.
-    2. If column A doesn't have at least one uppercase word, turn it red.
+    Build the conditional formatting requests of apply_cell_color_verification.
 
-    :param sheets_service: The Google Sheets API service object.
-    :param spreadsheet_id: The ID of the spreadsheet where the sheet is located.
     :param sheet_id: The ID of the sheet.
     :param rows: The number of rows in the sheet.
+    :param separator: The formula separator of the spreadsheet locale.
+    :return: The list of addConditionalFormatRule requests.
     """
     requests = []
     # For both columns A and C
@@ -292,6 +294,20 @@ def apply_cell_color_verification(sheets_service, spreadsheet_id, sheet_id, rows
                     }
                 }
             )
+    return requests
+
+
+def apply_cell_color_verification(sheets_service, spreadsheet_id, sheet_id, rows, separator=","):
+    """
+    1. If a cell is empty, turn it red.
+    2. If column A doesn't have at least one uppercase word, turn it red.
+
+    :param sheets_service: The Google Sheets API service object.
+    :param spreadsheet_id: The ID of the spreadsheet where the sheet is located.
+    :param sheet_id: The ID of the sheet.
+    :param rows: The number of rows in the sheet.
+    """
+    requests = build_color_verification_requests(sheet_id, rows, separator)
 
     # Batch update the conditional formatting rules
     body = {"requests": requests}
@@ -328,3 +344,15 @@ def convert_excel_to_google_sheet(drive_service, file_id):
     print(f"Google Sheet : {converted_file.get('webViewLink')}")
     file_id = converted_file.get("id")
     return file_id
+
+
+def publish_table(drive_service, sheets_service, pdf_path, excel_path, folder_id):
+    """Upload the PDF and its Excel table to Google Drive and turn the table into a customized Google Sheet."""
+    upload_to_drive(drive_service, pdf_path, folder_id)
+    excel_drive_id = upload_to_drive(drive_service, excel_path, folder_id)
+
+    sheet_id = convert_excel_to_google_sheet(drive_service, excel_drive_id)
+
+    apply_sheet_customizations(sheets_service, sheet_id, 7)
+    # After conversion, delete the Excel file from Google Drive
+    delete_file_from_drive(drive_service, excel_drive_id)
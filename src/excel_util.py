@@ -1,34 +1,116 @@
+import csv
+import os
 import xlsxwriter
 
-def save_table(df, file_path):
-    # Create a workbook and add a worksheet
-    workbook = xlsxwriter.Workbook(file_path, {"nan_inf_to_errors": True})
-    worksheet = workbook.add_worksheet()
+TABLE_COLUMNS = [
+    "Name",
+    "Date Of Death",
+    "Declarant Name",
+    "City",
+    "Street",
+    "Phone",
+    "Email",
+    "Status",
+    "Image",
+]
 
-    # Write column headers
-    worksheet.write_row(0, 0, df.columns)
 
-    # Write data rows
-    for idx, row in df.iterrows():
-        worksheet.write_row(idx + 1, 0, row)
+class TableSink:
+    """
+    Stream result rows to the Excel file (and optionally CSV/Parquet copies) as they arrive.
 
-    # Get the correct table reference (adjust to 1-based indexing)
-    max_row = len(df)  # Number of rows in the dataframe
-    max_col = len(df.columns)  # Number of columns in the dataframe
+    The workbook is written in xlsxwriter's constant_memory mode, so every row is flushed
+    to disk once the next one is written and memory stays flat whatever the register size.
+    Rows must be written in order; the filter range and column widths are set on close().
+    """
 
-    # Create the correct reference for the table (Excel range)
-    table_ref = f"A1:{xlsxwriter.utility.xl_col_to_name(max_col - 1)}{max_row + 1}"
+    def __init__(self, file_path, columns=TABLE_COLUMNS, extra_formats=()):
+        """
+        :param file_path: The path of the .xlsx file to write.
+        :param columns: The column headers.
+        :param extra_formats: Optional copies to write next to the Excel file: "csv", "parquet".
+        """
+        self.columns = list(columns)
+        self.rows = 0
 
-    # Add a table to the worksheet
-    worksheet.add_table(table_ref, {
-        'name': 'MyTable',
-        'columns': [{'header': col} for col in df.columns],
-        'style': 'Table Style Medium 6',
-    })
+        self.workbook = xlsxwriter.Workbook(
+            file_path, {"nan_inf_to_errors": True, "constant_memory": True}
+        )
+        self.worksheet = self.workbook.add_worksheet()
+        # add_table() isn't available in constant_memory mode, so the header and the
+        # row banding of 'Table Style Medium 6' are applied as cell formats instead
+        header_format = self.workbook.add_format(
+            {"bold": True, "font_color": "#FFFFFF", "bg_color": "#4BACC6"}
+        )
+        self.band_format = self.workbook.add_format({"bg_color": "#DAEEF3"})
+        self.worksheet.write_row(0, 0, self.columns, header_format)
+        self.worksheet.freeze_panes(1, 0)
 
-    # Adjust column widths
-    for col_num, _ in enumerate(df.columns, start=0):
-        worksheet.set_column(col_num, col_num, 30)
+        base_path = os.path.splitext(file_path)[0]
+        self.csv_file = self.csv_writer = None
+        if "csv" in extra_formats:
+            self.csv_file = open(f"{base_path}.csv", "w", newline="", encoding="utf-8-sig")
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(self.columns)
 
-    # Close the workbook
-    workbook.close()
+        self.parquet_path = self.parquet_writer = None
+        self.parquet_rows = []
+        if "parquet" in extra_formats:
+            self.parquet_path = f"{base_path}.parquet"
+
+    def write_row(self, row):
+        """Append one result row to every output."""
+        self.rows += 1
+        row_format = self.band_format if self.rows % 2 else None
+        self.worksheet.write_row(self.rows, 0, row, row_format)
+
+        if self.csv_writer:
+            self.csv_writer.writerow(row)
+            self.csv_file.flush()
+
+        if self.parquet_path:
+            self.parquet_rows.append(row)
+            if len(self.parquet_rows) >= 500:
+                self._write_parquet_rows()
+
+    def _write_parquet_rows(self):
+        # pyarrow is only needed when the parquet copy is requested
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(column, pa.string()) for column in self.columns])
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(self.parquet_path, schema)
+        columns = [
+            [None if row[i] is None else str(row[i]) for row in self.parquet_rows]
+            for i in range(len(self.columns))
+        ]
+        self.parquet_writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        self.parquet_rows = []
+
+    def close(self):
+        """Finalize the filter range and column widths and close every output."""
+        self.worksheet.autofilter(0, 0, self.rows, len(self.columns) - 1)
+        self.worksheet.set_column(0, len(self.columns) - 1, 30)
+        self.workbook.close()
+
+        if self.csv_file:
+            self.csv_file.close()
+
+        if self.parquet_path:
+            if self.parquet_rows or self.parquet_writer is None:
+                self._write_parquet_rows()
+            self.parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save_table(rows, file_path, columns=TABLE_COLUMNS):
+    """Write all the rows to the Excel file at once."""
+    with TableSink(file_path, columns) as sink:
+        for row in rows:
+            sink.write_row(row)
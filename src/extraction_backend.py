@@ -0,0 +1,231 @@
+# extraction_backend.py
+
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from openai import OpenAI
+
+from .constants import *
+from .prompt_template import RESULT_FIELDS, build_messages, get_cached_tokens, parse_result
+from .text_filter import (
+    DECLARANT_ANCHOR,
+    DECLARANT_LINES,
+    POSTAL_CODE,
+    clean_lines,
+    condense_ocr_text,
+    estimate_tokens,
+    prompt_stats,
+)
+
+openai_client = OpenAI(api_key=GPT_KEY, base_url=GPT_BASE_URL)
+
+
+def build_request(text):
+    """Build the chat completion request (the keyword arguments of chat.completions.create) for the page text."""
+    # Only the parts of the page that can hold the fields are sent to the model
+    condensed_text = condense_ocr_text(text, PROMPT_TOKEN_BUDGET)
+    return {
+        "model": "gpt-4o-mini",
+        "messages": build_messages(condensed_text),
+        "response_format": {"type": "json_object"},
+    }
+
+
+def estimate_prompt_tokens(request):
+    """Estimate the prompt size of a request built by build_request."""
+    return sum(estimate_tokens(message["content"]) for message in request["messages"])
+
+
+def estimate_raw_prompt_tokens(text):
+    """Estimate the prompt size the page text would have without condensing it."""
+    return estimate_prompt_tokens({"messages": build_messages(text)})
+
+
+class ExtractionBackend(ABC):
+    """Reads the death certificate fields from the OCR text of a page."""
+
+    name = None
+
+    @abstractmethod
+    def extract(self, text: str):
+        """Return a dict of the prompt_template.RESULT_FIELDS in order, with string values."""
+
+
+class OpenAIBackend(ExtractionBackend):
+    """The fields are read by gpt-4o-mini from the condensed OCR text."""
+
+    name = "openai"
+
+    def extract(self, text: str):
+        request = build_request(text)
+        t = time.perf_counter()
+        response = openai_client.chat.completions.create(**request)
+        prompt_stats.add(
+            estimate_raw_prompt_tokens(text),
+            estimate_prompt_tokens(request),
+            response.usage.prompt_tokens,
+            get_cached_tokens(response.usage),
+            time.perf_counter() - t,
+        )
+        return parse_result(response.choices[0].message.content)
+
+
+MONTHS = {
+    "janvier": 1, "fevrier": 2, "février": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "aout": 8, "août": 8, "septembre": 9, "octobre": 10, "novembre": 11,
+    "decembre": 12, "décembre": 12,
+}
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})\s*[/.-]\s*(\d{1,2})\s*[/.-]\s*(\d{4}|\d{2})\b")
+WRITTEN_DATE = re.compile(r"\b(\d{1,2})(?:er)?\s+(" + "|".join(MONTHS) + r")\s+(\d{4})\b", re.IGNORECASE)
+DEATH_WORDS = re.compile(r"d[ée]c[ée]d[ée]e?|d[ée]c[èe]s", re.IGNORECASE)
+STREET_WORDS = (
+    r"rue|avenue|av\.?|boulevard|bd|place|chemin|all[ée]e|impasse|route|quai|cours|square|"
+    r"voie|sentier|passage|r[ée]sidence|lieu-dit|hameau|faubourg|cit[ée]"
+)
+STREET = re.compile(r"(\d+\s*(?:bis|ter)?\s*,?\s*)?\b(?:" + STREET_WORDS + r")\b", re.IGNORECASE)
+POSTAL_CITY = re.compile(r"\b\d{5}\s+([A-Za-zÀ-ÿ' -]+)")
+UPPERCASE_WORD = re.compile(r"\b[A-ZÀ-Ý][A-ZÀ-Ý'-]+\b")
+HEADER_WORDS = re.compile(r"acte|d[ée]c[èe]s|mairie|r[ée]publique|[ée]tat civil|extrait|copie", re.IGNORECASE)
+DEATH_TITLE = re.compile(r"\bacte\s+de\s+d[ée]c[èe]s\b", re.IGNORECASE)
+BIRTH_INTRO = re.compile(r"\bn[ée]e?\s+le\b", re.IGNORECASE)
+DATE_INTRO = re.compile(r"\s*(?:le|du|:)\s*:?\s*$", re.IGNORECASE)
+
+
+class RuleBasedBackend(ExtractionBackend):
+    """
+    Local, CPU only: the fields are found with patterns of the certificate layout.
+
+    Less accurate than the model on unusual layouts and bad OCR, but it needs no
+    network and takes milliseconds per page.
+    """
+
+    name = "rules"
+
+    def extract(self, text: str):
+        lines = clean_lines(text)
+        declarant_name, city, street = self._declarant(lines)
+        return dict(zip(RESULT_FIELDS, (
+            self._person(lines), self._date_of_death(lines), declarant_name, city, street
+        )))
+
+    @staticmethod
+    def _person(lines):
+        # The deceased's name is at the beginning, with the last name in capitals
+        for line in lines[:6]:
+            if DECLARANT_ANCHOR.search(line):
+                break
+            if HEADER_WORDS.search(line) and not DEATH_WORDS.match(line):
+                continue
+            if UPPERCASE_WORD.search(line) and len(line.split()) >= 2:
+                line = re.split(r",|\s+d[ée]c[ée]d[ée]e?\b|\s+n[ée]e?\b", line, flags=re.IGNORECASE)[0]
+                return line.strip(" .:")
+        return ""
+
+    @staticmethod
+    def _format_date(match):
+        day, month, year = match.groups()
+        if not month.isdigit():
+            month = MONTHS[month.lower()]
+        if len(year) == 2:
+            # Years after the current one are from the previous century
+            year = ("20" if int(year) <= time.localtime().tm_year % 100 else "19") + year
+        return f"{int(day):02d}/{int(month):02d}/{year}"
+
+    @staticmethod
+    def _death_intro(text):
+        """Return what follows the last death word of text, the title "Acte de décès" aside, or None."""
+        text = DEATH_TITLE.sub("", text)
+        matches = list(DEATH_WORDS.finditer(text))
+        return text[matches[-1].end():] if matches else None
+
+    @classmethod
+    def _date_of_death(cls, lines):
+        # Only a date after a death word, on its line or ending the previous one ("Décédé le" / "14 mars 2024").
+        # Other dates are births, registrations, ... even on the line about the death ("né le")
+        for i, line in enumerate(lines):
+            for pattern in (NUMERIC_DATE, WRITTEN_DATE):
+                for match in pattern.finditer(line):
+                    before = line[:match.start()]
+                    intro = cls._death_intro(before)
+                    if intro is None and i and not before.strip(" :.,-"):
+                        intro = cls._death_intro(lines[i - 1])
+                        if intro is not None and not DATE_INTRO.match(intro):
+                            intro = None
+                    if intro is None:
+                        continue
+                    # "né le" introduces the birth date, not the dates after it
+                    since_last_date = NUMERIC_DATE.split(WRITTEN_DATE.split(intro)[-1])[-1]
+                    if not BIRTH_INTRO.search(since_last_date):
+                        return cls._format_date(match)
+        return ""
+
+    @staticmethod
+    def _declarant(lines):
+        """Return the declarant's name, city and street from the lines following "Déclarant"."""
+        for i, line in enumerate(lines):
+            match = DECLARANT_ANCHOR.search(line)
+            if match is None:
+                continue
+            following = lines[i + 1:i + 1 + DECLARANT_LINES]
+            rest = line[match.end():].lstrip(" e:.-")
+            if not rest:
+                if not following:
+                    return "", "", ""
+                rest, following = following[0], following[1:]
+
+            # The name ends with its line, or where the address starts on it
+            name, address = rest, ""
+            street_match = STREET.search(rest)
+            if street_match:
+                name, address = rest[:street_match.start()], rest[street_match.start():]
+            elif "," in rest:
+                name, address = rest.split(",", 1)
+
+            # The address runs down to the postal code and city
+            block = [address]
+            for next_line in following:
+                block.append(next_line)
+                if POSTAL_CODE.search(next_line):
+                    break
+            block = " ".join(block).strip()
+
+            city = ""
+            postal = POSTAL_CITY.search(block)
+            if postal:
+                city = postal.group(1).strip(" ,.-")
+                block = block[:postal.start()]
+
+            street_match = STREET.search(block)
+            if street_match:
+                street = block[street_match.start():]
+            else:
+                # Without a street word, only what follows the name on its line
+                street = POSTAL_CODE.split(address)[0]
+            return name.strip(" ,.-:"), city, street.strip(" ,.-")
+        return "", "", ""
+
+
+EXTRACTION_BACKENDS = {backend.name: backend for backend in (OpenAIBackend, RuleBasedBackend)}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def set_backend(name):
+    """Select the extraction backend of this run by name (see EXTRACTION_BACKENDS)."""
+    global _backend
+    if name not in EXTRACTION_BACKENDS:
+        raise ValueError(f"Unknown extraction backend {name!r}, choose from {', '.join(EXTRACTION_BACKENDS)}")
+    with _backend_lock:
+        _backend = EXTRACTION_BACKENDS[name]()
+
+
+def get_backend():
+    """Return the backend of this run, EXTRACTION_BACKEND unless another one was set."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = EXTRACTION_BACKENDS[EXTRACTION_BACKEND]()
+        return _backend
@@ -0,0 +1,116 @@
+# google_session.py
+
+import os
+import pickle
+import threading
+
+import gspread
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.transport.requests import AuthorizedSession, Request
+from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+
+from .constants import TOKEN_FILE
+
+
+class _SharedCredentials:
+    """
+    Stand-in for the credentials given to the transports, so that every token
+    refresh, whichever client triggers it, goes through GoogleSession.refresh().
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    @property
+    def token(self):
+        return self._session.creds.token
+
+    def before_request(self, request, method, url, headers):
+        self._session.refresh()
+        self._session.creds.apply(headers)
+
+    def refresh(self, request):
+        # Called after a 401: the token was rejected even if it looks valid
+        self._session.refresh(stale_token=self._session.creds.token)
+
+
+class GoogleSession:
+    """
+    The one authenticated transport layer used by every Google call.
+
+    - Drive and Sheets API clients: httplib2 is not thread-safe, so each thread gets
+      its own keep-alive connection and its own clients, built once and reused.
+    - gspread and plain REST calls (userinfo): one requests session with a
+      connection pool, shared by all threads.
+    - Credentials are refreshed in one place, under a lock, and saved to TOKEN_FILE.
+    """
+
+    def __init__(self, creds, pool_size=16):
+        self.creds = creds
+        self.credentials = _SharedCredentials(self)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.http_session = AuthorizedSession(self.credentials)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.http_session.mount("https://", adapter)
+        # Token refreshes go through their own session, outside the authorized one
+        self._refresh_request = Request()
+
+    def refresh(self, stale_token=None):
+        """
+        Refresh the credentials if they expired, or if stale_token was rejected and
+        no other thread has replaced it yet.
+        """
+        with self._lock:
+            if self.creds.valid and (stale_token is None or self.creds.token != stale_token):
+                return
+            self.creds.refresh(self._refresh_request)
+            with open(TOKEN_FILE, "wb") as token:
+                pickle.dump(self.creds, token)
+
+    def service(self, name, version):
+        """Return this thread's API client (e.g. "drive", "v3"), built on this thread's connection."""
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+            self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        if (name, version) not in services:
+            services[(name, version)] = build(
+                name, version, http=self._local.http, cache_discovery=False
+            )
+        return services[(name, version)]
+
+    def gspread_client(self):
+        """Return a gspread client using the pooled requests session."""
+        return gspread.Client(self.credentials, session=self.http_session)
+
+    def get(self, url, **kwargs):
+        """GET a Google REST URL with the pooled requests session."""
+        return self.http_session.get(url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def set_session(session):
+    global _session
+    _session = session
+
+
+def get_session():
+    """
+    Return the session of this run. Processes that didn't log in (workers) load
+    the credentials saved in TOKEN_FILE.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            if not os.path.exists(TOKEN_FILE):
+                raise FileNotFoundError(f"{TOKEN_FILE} not found, log in once with main.py")
+            with open(TOKEN_FILE, "rb") as token:
+                _session = GoogleSession(pickle.load(token))
+        return _session
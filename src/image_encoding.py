@@ -0,0 +1,105 @@
+# image_encoding.py
+
+import io
+import os
+import threading
+
+from PIL import Image
+
+# Output formats for the uploaded certificate copy: mimetype and file extension
+UPLOAD_FORMATS = {
+    "png": ("image/png", ".png"),  # The page image as rendered, unchanged
+    "gray": ("image/png", ".png"),  # 8-bit grayscale PNG
+    "bilevel": ("image/png", ".png"),  # 1-bit black and white PNG
+    "jpeg": ("image/jpeg", ".jpg"),  # JPEG, quality chosen to fit the target size
+    "webp": ("image/webp", ".webp"),  # WebP, quality chosen to fit the target size
+}
+
+
+class EncodingStats:
+    """Keep track of the bytes saved by uploading compact certificate copies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.encoded_bytes = 0
+
+    def add(self, original_bytes, encoded_bytes):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_bytes
+            self.encoded_bytes += encoded_bytes
+
+    def report(self, upload_pool=None):
+        """
+        Print the byte savings so far.
+
+        :param upload_pool: Optional, the UploadPool whose measured throughput is used
+            to estimate the upload time saved.
+        """
+        with self._lock:
+            saved = self.original_bytes - self.encoded_bytes
+            percent = saved / self.original_bytes * 100 if self.original_bytes else 0
+            line = (
+                f"Certificates : {self.original_bytes / 1024 / 1024:.1f} MB -> "
+                f"{self.encoded_bytes / 1024 / 1024:.1f} MB ({percent:.0f}% smaller)"
+            )
+        rate = upload_pool.throughput() if upload_pool else 0
+        if rate:
+            line += f", ~{saved / rate:.0f} sec of upload time saved"
+        print(line)
+
+
+encoding_stats = EncodingStats()
+
+
+def _save(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def _save_to_target(image, image_format, target_bytes):
+    """Save with the highest quality that fits in target_bytes (or the lowest quality if none fits)."""
+    low, high = 20, 95
+    best = _save(image, image_format, quality=low)
+    while low <= high:
+        quality = (low + high) // 2
+        data = _save(image, image_format, quality=quality)
+        if len(data) <= target_bytes:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def encode_for_upload(image_path, upload_format="png", target_kb=300):
+    """
+    Encode a compact copy of a page image for upload, leaving the original file untouched for OCR.
+
+    :param image_path: The path of the rendered page image.
+    :param upload_format: One of the UPLOAD_FORMATS keys.
+    :param target_kb: The size to aim for with the jpeg and webp formats.
+    :return: A tuple (data, mimetype, extension).
+    """
+    mimetype, extension = UPLOAD_FORMATS[upload_format]
+    original_bytes = os.path.getsize(image_path)
+
+    if upload_format == "png":
+        with open(image_path, "rb") as file:
+            data = file.read()
+    else:
+        with Image.open(image_path) as image:
+            if upload_format == "gray":
+                data = _save(image.convert("L"), "PNG", optimize=True)
+            elif upload_format == "bilevel":
+                data = _save(image.convert("1"), "PNG", optimize=True)
+            elif upload_format == "jpeg":
+                data = _save_to_target(image.convert("RGB"), "JPEG", target_kb * 1024)
+            else:
+                data = _save_to_target(image.convert("RGB"), "WEBP", target_kb * 1024)
+
+    encoding_stats.add(original_bytes, len(data))
+    return data, mimetype, extension
@@ -1,64 +1,135 @@
+import io
 import os
 import time
 import platform
 import subprocess
 import pytesseract
-from openai import OpenAI
+from concurrent.futures import Future
 from unidecode import unidecode
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 
+from .certificate_index import CertificateIndex
+from .extraction_backend import get_backend
+from .image_encoding import encode_for_upload
+from .pdf_processing import log_page
+from .prompt_template import PROMPT_VERSION
+from .text_filter import prompt_stats
 from .undertaker_data import get_undertaker_data
 from .constants import *
 from .utils import *
 
 # image_processing.py
 
+CERTIFICATE_PREFIX = "Acte de décès - "
+
+# Uploaded certificates by content hash, seeded from Drive at the start of a run
+certificate_index = CertificateIndex(CERTIFICATE_INDEX_FILE, CERTIFICATE_INDEX_FULL_LISTING_DAYS)
+
 
 def clean_name_for_comparison(name: str):
     """Clean the name by removing spaces, commas, and dashes."""
     return unidecode(name).replace(" ", "").replace(",", "").replace("-", "").lower()
 
 
-def upload_image_and_append_sheet(
-    name, image_path, drive_service, sheets_service, existing_images=None
-):
-    """
-    Upload the image to Google Drive and append its name and link to a Google Sheet.
-
-    If the image already exists in the sheet, skip upload and append.
-    """
-    # Clean the name for comparison
-    cleaned_name = clean_name_for_comparison(name)
+def _certificate_person(file_name: str):
+    """Return the cleaned person name of a certificate file name ("Acte de décès - <name>.<ext>")."""
+    stem = os.path.splitext(file_name)[0]
+    return clean_name_for_comparison(stem.removeprefix(CERTIFICATE_PREFIX))
 
-    # Check if the image already exists in the sheet
-    if existing_images is None:
-        existing_images = []  # Ensure there's an empty list if no data is passed
-    for image in existing_images:
-        if cleaned_name in clean_name_for_comparison(image[0]):
-            return image[1]
 
-    # Upload the image to the folder
-    file_name = f"Acte de décès - {name}.png"
+def _upload_certificate(drive_service, sheets_service, file_name, data, mimetype, checksum):
+    """Upload the certificate image to Google Drive and append its name and link to the image sheet."""
     file_metadata = {"name": file_name, "parents": [DEATH_CERTIFICATES_FOLDER_ID]}
-    media = MediaFileUpload(image_path, mimetype="image/png")
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype)
     request = drive_service.files().create(body=file_metadata, media_body=media, fields="id, webViewLink")
-    uploaded_file = execute_with_retry(request)
+    # Queued uploads run in the background, so they ride out Drive outages like the old 10 retries did
+    uploaded_file = execute_with_retry(request, UPLOAD_RETRIES, wait_for_circuit=True)
     # Get the file ID and web link
     file_link = uploaded_file.get("webViewLink")
 
     # Append the image name and link to the Google Sheet
-    row_data = [file_name, file_link]
     request = sheets_service.spreadsheets().values().append(
         spreadsheetId=IMAGE_SHEET_ID,
         range="Sheet1!A:B",
         valueInputOption="RAW",
-        body={"values": [row_data]},
+        body={"values": [[file_name, file_link]]},
     )
-    execute_with_retry(request)
-    existing_images.append(row_data)
+    execute_with_retry(request, UPLOAD_RETRIES, wait_for_circuit=True)
+    certificate_index.add(checksum, file_link)
     return file_link
 
 
+def upload_image_and_append_sheet(name, image_path, upload_pool, existing_images=None, encoded=None):
+    """
+    Queue the image for upload to Google Drive and for appending its name and link to a Google Sheet.
+
+    If a certificate for the same name is in the sheet, or an identical image is in the
+    certificate index, skip upload and append.
+    If encoded (data, mimetype, extension) is given, it is uploaded instead of encoding image_path.
+    Returns the link, or a Future resolving to it while the upload is in flight.
+    """
+    # Clean the name for comparison
+    cleaned_name = clean_name_for_comparison(name)
+
+    # Check if the image already exists in the sheet. Names must match exactly,
+    # so one person's name being part of another's doesn't share the certificate.
+    if existing_images is None:
+        existing_images = []  # Ensure there's an empty list if no data is passed
+    if cleaned_name:
+        for image in existing_images:
+            link = image[1]
+            if isinstance(link, Future) and link.done() and link.exception():
+                continue  # The upload failed, so it can't be reused
+            if cleaned_name == _certificate_person(image[0]):
+                return link
+
+    # Build a compact copy of the image and check if identical bytes were already uploaded
+    if encoded is None:
+        encoded = encode_for_upload(image_path, UPLOAD_IMAGE_FORMAT, UPLOAD_TARGET_KB)
+    data, mimetype, extension = encoded
+    checksum = CertificateIndex.checksum(data)
+    link = certificate_index.get(checksum)
+    if link is not None:
+        return link
+
+    # Queue the upload to the folder
+    file_name = f"{CERTIFICATE_PREFIX}{name}{extension}"
+    future = upload_pool.submit(
+        _upload_certificate, file_name, data, mimetype, checksum, size=len(data)
+    )
+    certificate_index.add_pending(checksum, future)
+    existing_images.append([file_name, future])
+    return future
+
+
+def wait_for_upload(row):
+    """
+    Replace the pending certificate link of a result row with the uploaded link.
+
+    If the upload failed, the Image cell is left empty (coloured for verification in
+    the sheet) so the record is still written.
+    """
+    if isinstance(row[-1], Future):
+        try:
+            row[-1] = row[-1].result()
+        except Exception as e:
+            print(f"Upload of the certificate of {row[0]} failed, its Image cell is left empty : {e}")
+            row[-1] = ""
+    return row
+
+
+def write_finished_rows(pending, sink, wait=False):
+    """
+    Write the leading result rows whose certificate upload has finished to the sink, keeping page order.
+
+    :param pending: A deque of result rows in page order.
+    :param sink: The TableSink to write to.
+    :param wait: Wait for the uploads of all the pending rows instead of stopping at the first unfinished one.
+    """
+    while pending and (wait or not isinstance(pending[0][-1], Future) or pending[0][-1].done()):
+        sink.write_row(wait_for_upload(pending.popleft()))
+
+
 def get_existing_image_names(sheets_service, sheet_id):
     """
     Retrieve and cache the existing image names from the Google Sheet.
@@ -72,90 +143,81 @@ def get_existing_image_names(sheets_service, sheet_id):
     return result.get("values", [])
 
 
-openai_client = OpenAI(api_key=GPT_KEY)
+def ocr_image(image_path):
+    # Pages rendered progressively already have their OCR text next to them
+    text_path = os.path.splitext(image_path)[0] + ".txt"
+    if os.path.exists(text_path):
+        with open(text_path, encoding="utf-8") as file:
+            return file.read()
+    return pytesseract.image_to_string(image_path, lang="fra")
 
-def get_image_result(image_path):
-    text = pytesseract.image_to_string(image_path, lang="fra")
-    prompt = (
-        "Text:\n"
-        + text
-        + """
-
-
-1. Filter out unnecessary characters like (*, #, ~, etc.).
-2. case sensitive so Don't change any case because I Identify fname and lname with case.
-3. If any information is missing or if you believe the text is incomplete or not a valid death certificate, return an empty string ("") for the respective fields.
-4. The declarant's information typically follows a pattern including the title 'Déclarant:' followed by their name and address. Correct any misspellings found in the text.
-5. Ensure the following:
-    - If any of the fields are not present, leave them as an empty string ("").
-    - Correct obvious misspellings in address where applicable.
-    - Return the result in the exact JSON format.
-
-Please format the output as a JSON object, following this structure exactly:
-
-{
-    "Dead person full name": "" (Extract from the beginning of the text. Do not change any Upper Case or Lower Case),
-    "Date of death": "" (The date should be in the format dd/mm/yyyy),
-    "Declarant Name": "" (Declarant full name),
-    "Declarant City": "" (Extract the city where the declarant is located),
-    "Declarant Street": "" (House number and street address associated with the declarant. Include only the house number and street address, excluding the city name.)
-}
-"""
-    )
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-            },
-        ],
-        response_format={"type": "json_object"},
-    )
-    result = eval(response.choices[0].message.content)
-    return result
+def get_image_result(image_path):
+    return get_backend().extract(ocr_image(image_path))
 
 
-def get_contact(address: str):
+def get_contact(address: str, undertaker_data=None):
     address = unidecode(address).replace(" ", "").replace("-", "").replace(",", "").lower()
-    undertaker_data = get_undertaker_data()
+    if undertaker_data is None:
+        undertaker_data = get_undertaker_data()
     for row in undertaker_data:
         if address in row[1]:
             return row[2], row[3]
     return None, None
 
-def get_declarant_contact(name : str):
+def get_declarant_contact(name : str, undertaker_data=None):
     name = unidecode(name).replace(" ", "").replace("-", "").replace(",", "").lower()
-    undertaker_data = get_undertaker_data()
+    if undertaker_data is None:
+        undertaker_data = get_undertaker_data()
     for row in undertaker_data:
         if name in row[0]:
             return row[2], row[3]
     return None, None
 
-def process_image(image, drive_service, sheets_service, existing_images):
+def complete_fields(image_result: dict[str, str]):
+    """
+    Look up the declarant's contact for the fields read from a page.
+
+    :return: [name, date of death, declarant name, city, street, phone, email]
+    """
+    name, dod, declarant_name, city, street = image_result.values()
+    phone = email = None
+    if declarant_name:
+        phone, email = get_declarant_contact(declarant_name)
+    if not(phone or email):
+        if street:
+            phone, email = get_contact(street)
+        if city and not(phone or email):
+            phone, email = get_contact(city)
+    return [name, dod, declarant_name, city, street, phone, email]
+
+
+def extract_page(image_path):
+    """Read the death certificate fields from the page image and look up the declarant's contact."""
+    return complete_fields(get_image_result(image_path))
+
+
+def log_prompt(pdf_name, page, prompt_version=PROMPT_VERSION):
+    """Record the prompt version and sizes of the page just extracted in the page log (only the model backends have a prompt)."""
+    if prompt_stats.last:
+        log_page(pdf_name, page, "prompt", "v{}, ~{} -> ~{} tokens estimated, {} counted by the API, {} cached".format(
+            prompt_version, *prompt_stats.last
+        ))
+
+
+def process_image(image, upload_pool, existing_images, pdf_name=""):
     result = None
     try:
         t = time.time()
-        city = street = dod = None
         image_path = f"{IMAGE_FOLDER}/{image}"
-        image_result: dict[str, str] = get_image_result(image_path)
-        name, dod, declarant_name, city, street = image_result.values()
-        phone = email = None
-        if declarant_name:
-            phone, email = get_declarant_contact(declarant_name)
-        if not(phone or email):
-            if street:
-                phone, email = get_contact(street)
-            if city and not(phone or email):
-                phone, email = get_contact(city)
-
+        fields = extract_page(image_path)
+        log_prompt(pdf_name, extract_number(image))
         print(f"     {image} in {int(time.time()-t)} sec", end="\r")
 
         file_link = upload_image_and_append_sheet(
-            name, image_path, drive_service, sheets_service, existing_images
+            fields[0], image_path, upload_pool, existing_images
         )
-        result = [name, dod, declarant_name, city, street, phone, email, "à envoyer", file_link]
+        result = fields + ["à envoyer", file_link]
     except Exception as e:
         print(e)
 
@@ -0,0 +1,195 @@
+# job_queue.py
+
+import json
+import os
+import sqlite3
+import time
+
+
+class JobQueue:
+    """
+    Durable queue of page-range jobs in a SQLite file, shared by the coordinator and its workers.
+
+    A worker claims a job with a lease and renews it after every page. When a worker
+    crashes its lease runs out and the job is handed to the next worker that asks.
+    PDF paths are stored relative to the queue file, so workers on other machines
+    can open the same share under a different mount point.
+    """
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3):
+        """
+        :param db_path: The path of the SQLite file.
+        :param lease_seconds: How long a claimed job stays reserved without a renewal.
+        :param max_attempts: How many times a job is tried before it is marked as failed.
+        """
+        self.base_dir = os.path.dirname(os.path.abspath(db_path))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                pdf TEXT NOT NULL,
+                first_page INTEGER NOT NULL,
+                last_page INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                pdf TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                fields TEXT NOT NULL,
+                image BLOB,
+                mimetype TEXT,
+                extension TEXT,
+                PRIMARY KEY (pdf, page)
+            );
+            """
+        )
+
+    def _key(self, pdf_path):
+        return os.path.relpath(os.path.abspath(pdf_path), self.base_dir).replace(os.sep, "/")
+
+    def pdf_path(self, key):
+        """Return the local path of a PDF stored in the queue."""
+        return os.path.join(self.base_dir, key)
+
+    def add_pdf(self, pdf_path, page_count, pages_per_job=10):
+        """Split the PDF into page-range jobs. If it is already queued, its failed jobs are retried."""
+        key = self._key(pdf_path)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0 WHERE pdf = ? AND status = 'failed'",
+                (key,),
+            )
+            if self.conn.execute("SELECT 1 FROM jobs WHERE pdf = ?", (key,)).fetchone() is None:
+                self.conn.executemany(
+                    "INSERT INTO jobs (pdf, first_page, last_page) VALUES (?, ?, ?)",
+                    [
+                        (key, first, min(first + pages_per_job, page_count))
+                        for first in range(0, page_count, pages_per_job)
+                    ],
+                )
+            self.conn.execute("COMMIT")
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker):
+        """
+        Lease the next pending job, or a job whose lease has run out.
+
+        :return: A tuple (job_id, pdf_key, first_page, last_page) or None if there is nothing to do.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs that keep crashing their workers are not handed out again
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = 'lease expired'
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, self.max_attempts),
+            )
+            job = self.conn.execute(
+                """
+                SELECT id, pdf, first_page, last_page FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if job:
+                self.conn.execute(
+                    """
+                    UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE id = ?
+                    """,
+                    (worker, now + self.lease_seconds, job[0]),
+                )
+            self.conn.execute("COMMIT")
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+        return job
+
+    def renew(self, job_id, worker):
+        """Extend the lease of a job. Returns False if the job was given to another worker."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + self.lease_seconds, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, results):
+        """
+        Store the results of a job and mark it as done.
+
+        :param results: A list of (page, fields, encoded) tuples, where encoded is the
+            (data, mimetype, extension) of the certificate copy to upload.
+        :return: False if the job was given to another worker in the meantime.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT pdf FROM jobs WHERE id = ? AND worker = ? AND status = 'leased'",
+                (job_id, worker),
+            ).fetchone()
+            if row is None:
+                self.conn.execute("ROLLBACK")
+                return False
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (row[0], page, json.dumps(fields), *encoded)
+                    for page, fields, encoded in results
+                ],
+            )
+            self.conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (job_id,))
+            self.conn.execute("COMMIT")
+            return True
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def release(self, job_id, worker, error):
+        """Give up a job after an error, so it can be retried or marked as failed."""
+        self.conn.execute(
+            """
+            UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                worker = NULL, lease_expires = NULL, error = ?
+            WHERE id = ? AND worker = ?
+            """,
+            (self.max_attempts, str(error), job_id, worker),
+        )
+
+    def progress(self, pdf_path):
+        """Return (total, done, failed) job counts for the PDF."""
+        return self.conn.execute(
+            """
+            SELECT COUNT(*), COALESCE(SUM(status = 'done'), 0), COALESCE(SUM(status = 'failed'), 0)
+            FROM jobs WHERE pdf = ?
+            """,
+            (self._key(pdf_path),),
+        ).fetchone()
+
+    def results(self, pdf_path):
+        """Yield (page, fields, encoded) for every extracted page of the PDF, in page order."""
+        cursor = self.conn.execute(
+            "SELECT page, fields, image, mimetype, extension FROM results WHERE pdf = ? ORDER BY page",
+            (self._key(pdf_path),),
+        )
+        for page, fields, image, mimetype, extension in cursor:
+            yield page, json.loads(fields), (image, mimetype, extension)
+
+    def remove_pdf(self, pdf_path):
+        """Delete the jobs and results of a finalized PDF."""
+        key = self._key(pdf_path)
+        self.conn.execute("DELETE FROM results WHERE pdf = ?", (key,))
+        self.conn.execute("DELETE FROM jobs WHERE pdf = ?", (key,))
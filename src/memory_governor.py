@@ -0,0 +1,114 @@
+# memory_governor.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .constants import MEMORY_BUDGET_MB
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_rss():
+    """Return the resident memory of this process in bytes, or None where it can't be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        # Linux without psutil: resident pages are the second field
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+class MemoryGovernor:
+    """
+    Keeps the memory held by rendered pages and queued uploads under a budget.
+
+    Rendering and uploads reserve the bytes of their buffers before creating them and
+    release them when the buffers are freed. A reservation waits while the reserved
+    bytes, or the process RSS, would exceed the budget, and other reservations are
+    still held that will free memory. A reservation made while nothing else is held
+    (apart from the caller's own, see acquire) always goes through, so a page bigger
+    than the budget slows the run but can't block it.
+    """
+
+    def __init__(self, budget_mb=1024, poll_seconds=0.5):
+        self.budget = budget_mb * 1024 * 1024
+        self.poll_seconds = poll_seconds
+        self._condition = threading.Condition()
+        self.held = 0
+        self.peak_held = 0
+        self.peak_rss = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _over_budget(self, size, own):
+        if self.held <= own:
+            return False
+        if self.held + size > self.budget:
+            return True
+        rss = get_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+            return rss + size > self.budget
+        return False
+
+    def acquire(self, size, own=0):
+        """
+        Reserve size bytes, waiting while the budget is used.
+
+        :param own: The bytes the caller already holds and keeps while waiting. They
+            can't be released by anyone else, so only the other reservations are waited for.
+        """
+        with self._condition:
+            if self._over_budget(size, own):
+                self.waits += 1
+                t = time.time()
+                # RSS isn't notified, so it is checked again periodically
+                while self._over_budget(size, own):
+                    self._condition.wait(self.poll_seconds)
+                self.wait_seconds += time.time() - t
+            self.held += size
+            self.peak_held = max(self.peak_held, self.held)
+
+    def release(self, size):
+        with self._condition:
+            self.held -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size):
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    def reset_peaks(self):
+        """Start measuring the peaks of a new PDF."""
+        with self._condition:
+            self.peak_held = self.held
+            self.peak_rss = get_rss() or 0
+            self.waits = 0
+            self.wait_seconds = 0.0
+
+    def report(self):
+        """Print the peak memory since reset_peaks() and the time spent waiting for memory."""
+        with self._condition:
+            rss = get_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+            peak_rss = f"{self.peak_rss / 1024 / 1024:.0f} MB" if self.peak_rss else "unknown"
+            print(
+                f"Memory : peak {self.peak_held / 1024 / 1024:.0f} MB in pages and uploads, "
+                f"peak RSS {peak_rss} (budget {self.budget / 1024 / 1024:.0f} MB), "
+                f"waited {self.waits} times ({self.wait_seconds:.1f} sec)"
+            )
+
+
+memory_governor = MemoryGovernor(MEMORY_BUDGET_MB)
@@ -0,0 +1,89 @@
+# page_filter.py
+
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+
+# Pages are measured at this width whatever their resolution, so the thresholds don't depend on the DPI
+THUMBNAIL_WIDTH = 512
+
+
+def page_thumbnail(image: Image.Image, width=THUMBNAIL_WIDTH):
+    """Return the page in grayscale, area-averaged to a fixed width, as a uint8 array."""
+    gray = image.convert("L")
+    height = max(1, round(gray.height * width / gray.width))
+    return np.asarray(gray.resize((width, height), Image.BOX))
+
+
+def ink_coverage(image: Image.Image):
+    """
+    Return the share of the page covered by ink, ignoring a 5% margin where scanner edges show up.
+
+    Darkness is summed relative to the paper (the median) above the scan noise, so the
+    anti-aliased strokes of low resolution renders count as much as sharp ones.
+    """
+    gray = page_thumbnail(image).astype(np.float32)
+    height, width = gray.shape
+    margin_y, margin_x = height // 20, width // 20
+    gray = gray[margin_y : height - margin_y, margin_x : width - margin_x]
+    paper = float(np.median(gray))
+    noise = 1.4826 * float(np.median(np.abs(gray - paper)))
+    darkness = np.clip(paper - gray - 3 * noise, 0, None)
+    return float(darkness.sum()) / (max(paper, 1.0) * gray.size)
+
+
+def difference_hash(image: Image.Image, hash_size=16):
+    """Return the perceptual difference hash of the page as an int of hash_size * hash_size bits."""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PageFilter:
+    """
+    Flag pages that can't yield a record before they reach OCR: blank pages, pages
+    identical to a page already seen during this run and, optionally, near-duplicates.
+    """
+
+    def __init__(self, blank_ink_ratio=0.0005, duplicate_distance=None):
+        """
+        :param blank_ink_ratio: Pages with less of their area covered by ink than this are blank.
+        :param duplicate_distance: Pages whose difference hashes differ by at most this many
+            bits are near-duplicates (rescans). The hash captures the layout more than the
+            text, so certificates printed on the same form look alike: only enable it for
+            registers without a shared form. None disables the check.
+        """
+        self.blank_ink_ratio = blank_ink_ratio
+        self.duplicate_distance = duplicate_distance
+        self.checksums = {}  # Label -> checksum of the pages kept so far
+        self.hashes = {}  # Label -> difference hash of the pages kept so far
+
+    def check(self, image: Image.Image, label: str):
+        """
+        Return the reason to skip the page, or None if it should be processed.
+
+        :param image: The rendered page.
+        :param label: How to refer to this page when a later page duplicates it.
+        """
+        coverage = ink_coverage(image)
+        if coverage < self.blank_ink_ratio:
+            return f"blank page (ink {coverage:.3%})"
+
+        # A page seen again under its own label is a retry, not a duplicate
+        checksum = hashlib.md5(page_thumbnail(image).tobytes()).hexdigest()
+        for seen_label, seen_checksum in self.checksums.items():
+            if checksum == seen_checksum and seen_label != label:
+                return f"identical to {seen_label}"
+        self.checksums[label] = checksum
+
+        if self.duplicate_distance is not None:
+            page_hash = difference_hash(image)
+            for seen_label, seen_hash in self.hashes.items():
+                distance = (page_hash ^ seen_hash).bit_count()
+                if distance <= self.duplicate_distance and seen_label != label:
+                    return f"duplicate of {seen_label} (distance {distance})"
+            self.hashes[label] = page_hash
+        return None
@@ -1,8 +1,15 @@
 import os
+import csv
+import time
 import fitz
+import pytesseract
+from collections import Counter
 from tqdm import tqdm
 from PIL import Image, ImageEnhance
 
+from .constants import OCR_MIN_CONFIDENCE, OCR_STEPS, PAGE_LOG_FILE, PROGRESSIVE_OCR
+from .memory_governor import memory_governor
+
 def delete_images(directory_path):
     try:
         for filename in os.listdir(directory_path):
@@ -14,25 +21,154 @@ def delete_images(directory_path):
             os.makedirs(directory_path)
         pass
 
-def pdf_to_images(pdf_path, output_folder, resolution, contrast_factor=3):
+def log_page(pdf_name, page, event, detail=""):
+    """Record a per-page event (skipped page, chosen resolution, ...) in the page log."""
+    new_file = not os.path.exists(PAGE_LOG_FILE)
+    with open(PAGE_LOG_FILE, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(["Time", "PDF", "Page", "Event", "Detail"])
+        writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), pdf_name, page, event, detail])
+
+def get_page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+def _page_bytes(page, resolution):
+    """Estimate the memory of a rendered page: the pixmap, its PIL copy and the enhanced image, in RGB."""
+    scale = resolution / 72
+    return int(page.rect.width * scale) * int(page.rect.height * scale) * 3 * 3
+
+def _render_page(page, resolution, contrast_factor):
+    """Render the page and return it as a PIL image, as is and with its contrast enhanced for OCR."""
+    image = page.get_pixmap(matrix=fitz.Matrix(resolution / 72, resolution / 72))
+    pil_image = Image.frombytes("RGB", [image.width, image.height], image.samples)
+    enhancer = ImageEnhance.Contrast(pil_image)
+    return pil_image, enhancer.enhance(contrast_factor)
+
+def _is_skipped(page_filter, pil_image, pdf_name, page_number):
+    """Check the page against the PageFilter and log it if it is skipped."""
+    if page_filter is None:
+        return False
+    reason = page_filter.check(pil_image, f"{pdf_name} page {page_number}")
+    if reason:
+        tqdm.write(f"Skipping page {page_number} : {reason}")
+        log_page(pdf_name, page_number, "skipped", reason)
+    return bool(reason)
+
+def ocr_with_confidence(image):
+    """Return the OCR text of the image and Tesseract's mean word confidence (0-100)."""
+    data = pytesseract.image_to_data(image, lang="fra", output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(float(data["conf"][i]))
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0
+    return text, confidence
+
+def pdf_to_images(pdf_path, output_folder, resolution, contrast_factor=3, pages=None, page_filter=None, on_page=None):
+    """
+    Render the pages of the PDF (all of them, or the zero-based page numbers in pages) to page-N.png files.
+
+    Pages rejected by the optional PageFilter are logged and not saved.
+    The optional on_page() is called after each page, saved or skipped.
+    """
     delete_images(output_folder)
     print("\nGetting All Images From PDF...")
+    pdf_name = os.path.basename(pdf_path)
     doc = fitz.open(pdf_path)
+    if pages is None:
+        pages = range(len(doc))
     
-    for i in tqdm(range(len(doc)), ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"):
+    for i in tqdm(pages, ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"):
         page = doc.load_page(i)
-        # Get the image of the page
-        image = page.get_pixmap(matrix=fitz.Matrix(resolution / 72, resolution / 72))
         image_path = f"{output_folder}/page-{i + 1}.png"
-        
-        # Convert to PIL Image to manipulate contrast
-        pil_image = Image.frombytes("RGB", [image.width, image.height], image.samples)
-        
-        # Enhance the contrast of the image for better OCR
-        enhancer = ImageEnhance.Contrast(pil_image)
-        enhanced_image = enhancer.enhance(contrast_factor)
-        
-        # Save the enhanced image
-        enhanced_image.save(image_path)
+        # Wait for memory if the pages and uploads in flight use the budget
+        with memory_governor.reserve(_page_bytes(page, resolution)):
+            pil_image, enhanced_image = _render_page(page, resolution, contrast_factor)
+
+            # Skip blank and duplicate pages so they never reach OCR
+            if not _is_skipped(page_filter, pil_image, pdf_name, i + 1):
+                # Save the enhanced image
+                enhanced_image.save(image_path)
+            del pil_image, enhanced_image
+        if on_page:
+            on_page()
     
-    doc.close()
\ No newline at end of file
+    doc.close()
+
+def pdf_to_images_progressive(pdf_path, output_folder, steps, min_confidence, pages=None, page_filter=None, on_page=None):
+    """
+    Render and OCR each page with the first (resolution, contrast_factor) of steps, and only
+    try the next steps while Tesseract's mean word confidence is below min_confidence.
+
+    The best scoring image is saved as page-N.png with its OCR text in page-N.txt
+    (read back by ocr_image), and the chosen resolution is recorded in the page log.
+    The optional on_page() is called after each page, saved or skipped.
+    """
+    delete_images(output_folder)
+    print("\nGetting All Images From PDF...")
+    pdf_name = os.path.basename(pdf_path)
+    doc = fitz.open(pdf_path)
+    if pages is None:
+        pages = range(len(doc))
+    chosen = Counter()
+
+    for i in tqdm(pages, ncols=60, bar_format="{percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"):
+        page = doc.load_page(i)
+        best = None
+        best_size = 0
+        try:
+            for step, (resolution, contrast_factor) in enumerate(steps):
+                # Wait for memory if the pages and uploads in flight use the budget
+                size = _page_bytes(page, resolution)
+                # The best render so far is kept while waiting, so it must not be waited for
+                memory_governor.acquire(size, own=best_size)
+                try:
+                    pil_image, enhanced_image = _render_page(page, resolution, contrast_factor)
+                    if step == 0 and _is_skipped(page_filter, pil_image, pdf_name, i + 1):
+                        break
+                    text, confidence = ocr_with_confidence(enhanced_image)
+                    # Only the best render so far is kept in memory
+                    if best is None or confidence > best[0]:
+                        best = (confidence, resolution, contrast_factor, enhanced_image, text)
+                        size, best_size = best_size, size
+                finally:
+                    pil_image = enhanced_image = None
+                    memory_governor.release(size)
+                if confidence >= min_confidence:
+                    break
+            if best is not None:
+                confidence, resolution, contrast_factor, enhanced_image, text = best
+                enhanced_image.save(f"{output_folder}/page-{i + 1}.png")
+        finally:
+            enhanced_image = None
+            memory_governor.release(best_size)
+        if best is not None:
+            with open(f"{output_folder}/page-{i + 1}.txt", "w", encoding="utf-8") as file:
+                file.write(text)
+            log_page(pdf_name, i + 1, "resolution", f"{resolution} dpi, contrast {contrast_factor}, confidence {confidence:.0f}")
+            chosen[resolution] += 1
+            best = None
+        if on_page:
+            on_page()
+
+    doc.close()
+    if chosen:
+        print("Resolutions : " + ", ".join(f"{dpi} dpi x {count}" for dpi, count in sorted(chosen.items())))
+
+def render_pdf(pdf_path, output_folder, pages=None, page_filter=None, on_page=None):
+    """
+    Render the pages for processing, progressively if PROGRESSIVE_OCR is on, else at 200 DPI.
+
+    The optional on_page() is called after each page, e.g. to show a long render is alive.
+    """
+    if PROGRESSIVE_OCR:
+        pdf_to_images_progressive(pdf_path, output_folder, OCR_STEPS, OCR_MIN_CONFIDENCE, pages, page_filter, on_page)
+    else:
+        pdf_to_images(pdf_path, output_folder, 200, 3, pages, page_filter, on_page)
@@ -0,0 +1,138 @@
+# preflight.py
+
+import json
+import os
+import threading
+
+import fitz
+from PIL import Image
+
+from .constants import BLANK_INK_RATIO, PREFLIGHT_DPI, PREFLIGHT_SAMPLE_PAGES
+from .page_filter import ink_coverage
+
+# Per-page costs used until a run has been recorded in RUN_STATS_FILE
+DEFAULT_COSTS = {
+    "render_seconds": 1.5,  # Per page of the PDF
+    "extract_seconds": 3.0,  # Per processed page: OCR, extraction and the pause between pages
+    "prompt_tokens": 450,  # Per processed page
+    "upload_bytes": 150_000,  # Per processed page
+}
+
+
+class RunStats:
+    """
+    Totals of the previous runs, kept in RUN_STATS_FILE: pages, processed pages,
+    render and extraction seconds, prompt tokens and uploaded bytes.
+    """
+
+    FIELDS = ("pages", "processed_pages", "render_seconds", "extract_seconds", "prompt_tokens", "upload_bytes")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.totals.update(json.load(file))
+
+    def add(self, **values):
+        """Add the measures of one PDF to the totals and save them."""
+        with self._lock:
+            for field, value in values.items():
+                self.totals[field] += value
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(self.totals, file, indent=2)
+
+    def costs(self):
+        """Return the measured per-page costs, or the defaults for the stages not measured yet."""
+        with self._lock:
+            totals = dict(self.totals)
+        costs = dict(DEFAULT_COSTS)
+        if totals["pages"]:
+            costs["render_seconds"] = totals["render_seconds"] / totals["pages"]
+        if totals["processed_pages"]:
+            for field in ("extract_seconds", "prompt_tokens", "upload_bytes"):
+                if totals[field]:
+                    costs[field] = totals[field] / totals["processed_pages"]
+        return costs
+
+
+def inspect_pdf(pdf_path, resolution=PREFLIGHT_DPI, sample_pages=PREFLIGHT_SAMPLE_PAGES):
+    """
+    Open the PDF and return its page count, and the share of pages with a text layer
+    and of blank pages, measured on up to sample_pages pages spread over the PDF and
+    rendered in grayscale at a low resolution.
+    """
+    with fitz.open(pdf_path) as doc:
+        pages = len(doc)
+        step = max(1, pages / sample_pages)
+        sampled = sorted({int(k * step) for k in range(min(pages, sample_pages))})
+        text_pages = 0
+        blank_pages = 0
+        for i in sampled:
+            page = doc.load_page(i)
+            if page.get_text("text").strip():
+                text_pages += 1
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(resolution / 72, resolution / 72), colorspace=fitz.csGRAY)
+            image = Image.frombytes("L", [pixmap.width, pixmap.height], pixmap.samples)
+            if ink_coverage(image) < BLANK_INK_RATIO:
+                blank_pages += 1
+    return {
+        "pages": pages,
+        "text_ratio": text_pages / len(sampled) if sampled else 0,
+        "blank_ratio": blank_pages / len(sampled) if sampled else 0,
+    }
+
+
+def estimate_pdf(info, costs):
+    """Estimate the wall time (sec), prompt tokens and upload bytes of a PDF from its inspection."""
+    processed = info["pages"] * (1 - info["blank_ratio"])
+    return {
+        "seconds": info["pages"] * costs["render_seconds"] + processed * costs["extract_seconds"],
+        "prompt_tokens": processed * costs["prompt_tokens"],
+        "upload_bytes": processed * costs["upload_bytes"],
+    }
+
+
+def _format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}" if hours else f"{rest // 60}m{rest % 60:02d}"
+
+
+def plan(pdf_files, input_folder, run_stats):
+    """
+    Inspect the PDFs, print their estimates and the totals, and return the PDFs in
+    processing order: the quickest first, so finished tables are published early.
+
+    :param pdf_files: The PDF file names in input_folder.
+    :param run_stats: The RunStats of the previous runs, for the per-page costs.
+    """
+    if not pdf_files:
+        return []
+    costs = run_stats.costs()
+    history = "previous runs" if run_stats.totals["pages"] else "default costs, no run recorded yet"
+    print(f"\nPre-flight ({history}) :\n")
+
+    estimates = {}
+    for pdf in pdf_files:
+        try:
+            info = inspect_pdf(f"{input_folder}/{pdf}")
+        except Exception as e:
+            print(f"{pdf} : can't be opened, {e}")
+            continue
+        estimates[pdf] = estimate = estimate_pdf(info, costs)
+        text_layer = f", {info['text_ratio']:.0%} with a text layer" if info["text_ratio"] else ""
+        print(
+            f"{pdf} : {info['pages']} pages, {info['blank_ratio']:.0%} blank{text_layer} -> "
+            f"~{_format_duration(estimate['seconds'])}, {estimate['prompt_tokens'] / 1000:.0f}k tokens, "
+            f"{estimate['upload_bytes'] / 1024 / 1024:.0f} MB"
+        )
+
+    print(
+        f"\nTotal : ~{_format_duration(sum(e['seconds'] for e in estimates.values()))}, "
+        f"{sum(e['prompt_tokens'] for e in estimates.values()) / 1000:.0f}k prompt tokens, "
+        f"{sum(e['upload_bytes'] for e in estimates.values()) / 1024 / 1024:.0f} MB to upload"
+    )
+    order = sorted(estimates, key=lambda pdf: estimates[pdf]["seconds"])
+    # PDFs that couldn't be inspected keep their place at the end
+    return order + [pdf for pdf in pdf_files if pdf not in estimates]
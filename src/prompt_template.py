@@ -0,0 +1,90 @@
+# prompt_template.py
+
+import json
+
+# Bump when the instructions or the schema change. Recorded in the page log and the batch
+# state, so results can be traced to the prompt that produced them
+PROMPT_VERSION = "2"
+
+# Keys of the JSON object returned by the model, in the order of the table columns
+RESULT_FIELDS = (
+    "Dead person full name",
+    "Date of death",
+    "Declarant Name",
+    "Declarant City",
+    "Declarant Street",
+)
+
+# Identical for every page and sent first, so the provider can cache the prompt prefix
+SYSTEM_PROMPT = """You read the OCR text of French death certificates and extract fields from it.
+
+1. Filter out unnecessary characters like (*, #, ~, etc.).
+2. case sensitive so Don't change any case because I Identify fname and lname with case.
+3. If any information is missing or if you believe the text is incomplete or not a valid death certificate, return an empty string ("") for the respective fields.
+4. The declarant's information typically follows a pattern including the title 'Déclarant:' followed by their name and address. Correct any misspellings found in the text.
+5. Ensure the following:
+    - If any of the fields are not present, leave them as an empty string ("").
+    - Correct obvious misspellings in address where applicable.
+    - Return the result in the exact JSON format.
+
+Please format the output as a JSON object, following this structure exactly:
+
+{
+    "Dead person full name": "" (Extract from the beginning of the text. Do not change any Upper Case or Lower Case),
+    "Date of death": "" (The date should be in the format dd/mm/yyyy),
+    "Declarant Name": "" (Declarant full name),
+    "Declarant City": "" (Extract the city where the declarant is located),
+    "Declarant Street": "" (House number and street address associated with the declarant. Include only the house number and street address, excluding the city name.)
+}
+"""
+
+
+def build_messages(text: str):
+    """Return the chat messages for the page text: the static instructions first, the page last."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "Text:\n" + text},
+    ]
+
+
+def parse_result(content: str):
+    """
+    Parse the model's JSON answer.
+
+    :return: A dict of the RESULT_FIELDS in order, with string values.
+    :raises ValueError: If the answer is not a JSON object with these fields.
+    """
+    try:
+        result = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"The answer is not valid JSON: {e}") from e
+    if not isinstance(result, dict):
+        raise ValueError(f"The answer is not a JSON object: {content!r}")
+    missing = [field for field in RESULT_FIELDS if field not in result]
+    if missing:
+        raise ValueError(f"The answer is missing {', '.join(missing)}")
+
+    fields = {}
+    for field in RESULT_FIELDS:
+        value = result[field]
+        if value is None:
+            value = ""
+        if not isinstance(value, str):
+            raise ValueError(f"{field} is not a string: {value!r}")
+        fields[field] = value.strip()
+    return fields
+
+
+def get_cached_tokens(usage):
+    """
+    Return the prompt tokens served from the provider's prompt cache, or 0.
+
+    :param usage: The usage of a chat completion, as a response object or as the dict of a batch result.
+    """
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+    else:
+        details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
@@ -0,0 +1,232 @@
+# retry.py
+
+import http.client
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+# Google returns some rate limit errors as 403 with one of these reasons
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "sharingRateLimitExceeded"}
+
+
+class RetryError(Exception):
+    """Raised when a transient error is still failing after all the attempts."""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+def get_status(error):
+    """Return the HTTP status of a Google API or OpenAI error, or None for other errors."""
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return getattr(error, "status_code", None)
+
+
+def _get_reasons(error):
+    try:
+        content = json.loads(error.content.decode("utf-8"))
+        return {detail.get("reason") for detail in content["error"].get("errors", [])}
+    except Exception:
+        return set()
+
+
+def is_transient(error):
+    """Return True if the request may succeed when sent again."""
+    status = get_status(error)
+    if status is not None:
+        if status == 403 and isinstance(error, HttpError):
+            return bool(_get_reasons(error) & RATE_LIMIT_REASONS)
+        return status in TRANSIENT_STATUSES
+    # Network level failures: resets, timeouts, DNS, broken responses
+    if isinstance(error, (OSError, http.client.HTTPException, httplib2.HttpLib2Error)):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def get_retry_after(error):
+    """Return the delay asked by the server in a Retry-After header, in seconds, or None."""
+    headers = getattr(error, "resp", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RetryStats:
+    """Thread-safe counters of the retry activity."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self.permanent_errors = 0
+        self.exhausted = 0
+        self.budget_rejections = 0
+        self.circuit_rejections = 0
+        self.circuit_waits = 0
+
+    def add(self, counter, value=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def report(self):
+        """Print the counters if anything was retried or failed."""
+        with self._lock:
+            if not (self.retries or self.permanent_errors or self.exhausted
+                    or self.budget_rejections or self.circuit_rejections or self.circuit_waits):
+                return
+            print(
+                f"Retries : {self.retries} ({self.wait_seconds:.0f} sec waiting), "
+                f"permanent errors {self.permanent_errors}, gave up {self.exhausted}, "
+                f"budget exhausted {self.budget_rejections}, circuit open {self.circuit_rejections} "
+                f"(waited out {self.circuit_waits} times)"
+            )
+
+
+class RetryBudget:
+    """
+    Token bucket limiting the retries of all threads together, so a failing
+    service doesn't get multiplied by every worker retrying at once.
+    """
+
+    def __init__(self, capacity=50, refill_per_second=0.5):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def try_spend(self):
+        """Take one retry from the budget. Returns False if there is none left."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def spend(self):
+        """Take one retry from the budget, waiting for it to refill if there is none left."""
+        while not self.try_spend():
+            time.sleep(1 / self.refill_per_second)
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker: after `threshold` consecutive transient failures the
+    endpoint is rejected for `cooldown` seconds, then a single trial call is let through.
+    """
+
+    def __init__(self, threshold=8, cooldown=60):
+        self._lock = threading.Lock()
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}  # endpoint -> consecutive failures
+        self.opened_at = {}  # endpoint -> time the circuit opened
+
+    def allow(self, endpoint):
+        with self._lock:
+            opened_at = self.opened_at.get(endpoint)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.cooldown:
+                # Half open: let one call through and restart the cooldown
+                self.opened_at[endpoint] = time.monotonic()
+                return True
+            return False
+
+    def wait(self, endpoint):
+        """Block until the endpoint's circuit lets a call through."""
+        while not self.allow(endpoint):
+            with self._lock:
+                opened_at = self.opened_at.get(endpoint)
+            remaining = self.cooldown - (time.monotonic() - opened_at) if opened_at is not None else 0
+            time.sleep(max(1.0, remaining))
+
+    def record_success(self, endpoint):
+        with self._lock:
+            self.failures.pop(endpoint, None)
+            self.opened_at.pop(endpoint, None)
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+            if self.failures[endpoint] >= self.threshold:
+                self.opened_at[endpoint] = time.monotonic()
+
+
+retry_stats = RetryStats()
+retry_budget = RetryBudget()
+circuit_breaker = CircuitBreaker()
+
+
+def retry_call(fn, endpoint, attempts=6, initial_delay=1, max_delay=60, wait_for_circuit=False):
+    """
+    Call fn(), retrying transient errors with capped exponential backoff and full jitter.
+
+    Permanent errors (400, 401, 404, ...) are raised at once. A Retry-After header
+    from the server replaces the computed delay. Retries are taken from the budget
+    shared by all threads, and calls fail fast while the endpoint's circuit is open.
+
+    :param fn: The function to call.
+    :param endpoint: The name of the endpoint, used for the circuit breaker and messages.
+    :param attempts: The maximum number of calls.
+    :param initial_delay: The backoff delay before the first retry.
+    :param max_delay: The cap of the backoff delay.
+    :param wait_for_circuit: Wait while the circuit is open and for the retry budget to
+        refill instead of failing, for background work that must ride out an outage.
+    :return: The return value of fn.
+    """
+    for attempt in range(attempts):
+        if not circuit_breaker.allow(endpoint):
+            if not wait_for_circuit:
+                retry_stats.add("circuit_rejections")
+                raise CircuitOpenError(f"Too many failures, {endpoint} is paused")
+            retry_stats.add("circuit_waits")
+            t = time.monotonic()
+            circuit_breaker.wait(endpoint)
+            retry_stats.add("wait_seconds", time.monotonic() - t)
+        try:
+            result = fn()
+            circuit_breaker.record_success(endpoint)
+            return result
+        except Exception as e:
+            if not is_transient(e):
+                retry_stats.add("permanent_errors")
+                raise
+            circuit_breaker.record_failure(endpoint)
+            if attempt == attempts - 1:
+                retry_stats.add("exhausted")
+                raise RetryError(f"Max retries reached for {endpoint}") from e
+            if wait_for_circuit:
+                retry_budget.spend()
+            elif not retry_budget.try_spend():
+                retry_stats.add("budget_rejections")
+                raise RetryError(f"Retry budget exhausted, giving up on {endpoint}") from e
+
+            delay = get_retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, initial_delay * 2 ** attempt))
+            print(f"Error {e}: Retrying in {delay:.1f} seconds...")
+            retry_stats.add("retries")
+            retry_stats.add("wait_seconds", delay)
+            time.sleep(delay)
@@ -0,0 +1,130 @@
+# text_filter.py
+
+import re
+import threading
+
+# Lines around these words hold the fields we extract
+DECLARANT_ANCHOR = re.compile(r"d[ée]clarant", re.IGNORECASE)
+DEATH_ANCHOR = re.compile(
+    r"d[ée]c[ée]d[ée]|d[ée]c[èe]s|\d{1,2}\s*[/.-]\s*\d{1,2}\s*[/.-]\s*\d{2,4}|"
+    r"janvier|f[ée]vrier|mars|avril|mai|juin|juillet|ao[ûu]t|septembre|octobre|novembre|d[ée]cembre",
+    re.IGNORECASE,
+)
+NOISE_CHARACTERS = re.compile(r"[*#~|_=<>{}\[\]\\^`¤§°«»“”„•·©®™]+")
+WHITESPACE = re.compile(r"\s+")
+POSTAL_CODE = re.compile(r"\b\d{5}\b")
+
+HEAD_LINES = 4  # The deceased's name is at the beginning of the certificate
+DECLARANT_LINES = 8  # How far after "Déclarant" to look for the postal code and city line
+
+
+def estimate_tokens(text: str):
+    """Rough token count of French text for the OpenAI tokenizers (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def clean_lines(text: str):
+    """Strip stray symbols, collapse whitespace and drop the lines that are mostly OCR noise."""
+    lines = []
+    for line in text.splitlines():
+        line = WHITESPACE.sub(" ", NOISE_CHARACTERS.sub(" ", line)).strip()
+        letters = sum(character.isalnum() for character in line)
+        if letters >= 3 and letters >= len(line.replace(" ", "")) * 0.6:
+            lines.append(line)
+    return lines
+
+
+def condense_ocr_text(text: str, token_budget=500):
+    """
+    Clean the OCR text and, if it is over the token budget, keep only the parts that
+    can hold the fields we extract.
+
+    The first lines (deceased's name), the lines from "Déclarant" to the declarant's
+    postal code and city, the lines around the death and date words, then the other
+    lines are kept in this order of priority until the token budget is used, and put
+    back in page order.
+    """
+    lines = clean_lines(text)
+    if sum(estimate_tokens(line) + 1 for line in lines) <= token_budget:
+        return "\n".join(lines)
+
+    priorities = {}
+    for i in range(min(HEAD_LINES, len(lines))):
+        priorities[i] = 0
+    for i, line in enumerate(lines):
+        if DECLARANT_ANCHOR.search(line):
+            # The declarant's name and address follow the title, down to the postal code and city
+            end = min(len(lines), i + 4)
+            for j in range(i + 1, min(len(lines), i + DECLARANT_LINES + 1)):
+                if POSTAL_CODE.search(lines[j]):
+                    end = max(end, j + 1)
+                    break
+            for j in range(max(0, i - 1), end):
+                priorities[j] = 0
+        elif DEATH_ANCHOR.search(line):
+            for j in range(max(0, i - 1), min(len(lines), i + 2)):
+                priorities[j] = min(priorities.get(j, 1), 1)
+
+    kept = set()
+    used = 0
+    for i in sorted(range(len(lines)), key=lambda i: (priorities.get(i, 2), i)):
+        tokens = estimate_tokens(lines[i]) + 1
+        if used + tokens > token_budget:
+            continue
+        kept.add(i)
+        used += tokens
+    return "\n".join(lines[i] for i in sorted(kept))
+
+
+class PromptStats:
+    """
+    Per-page and total prompt sizes before and after condensing the OCR text, both
+    estimated with estimate_tokens, with the prompt tokens counted by the API, those
+    served from the provider's cache and the request latency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.timed_requests = 0
+        self.seconds = 0.0
+        self.last = None  # (tokens before, tokens after, prompt tokens, cached tokens) of the last page
+
+    def add(self, tokens_before, tokens_after, prompt_tokens, cached_tokens=0, seconds=None):
+        """
+        :param tokens_before: The estimated prompt tokens without condensing the text.
+        :param tokens_after: The estimated prompt tokens of the condensed text, as sent.
+        :param prompt_tokens: The prompt tokens counted by the API.
+        :param cached_tokens: The prompt tokens the provider read from its prompt cache.
+        :param seconds: The request latency, None when unknown (batch results).
+        """
+        with self._lock:
+            self.pages += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            if seconds is not None:
+                self.timed_requests += 1
+                self.seconds += seconds
+            self.last = (tokens_before, tokens_after, prompt_tokens, cached_tokens)
+
+    def report(self):
+        with self._lock:
+            if not self.pages:
+                return
+            saved = 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0
+            print(
+                f"Prompt tokens : ~{self.tokens_before} -> ~{self.tokens_after} estimated "
+                f"for {self.pages} pages ({saved:.0%} smaller), {self.prompt_tokens} counted by the API"
+            )
+            cached = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0
+            latency = f", {self.seconds / self.timed_requests:.2f} sec per request" if self.timed_requests else ""
+            print(f"Cached prompt tokens : {self.cached_tokens} ({cached:.0%}){latency}")
+
+
+prompt_stats = PromptStats()
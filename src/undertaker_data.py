@@ -1,11 +1,34 @@
 from functools import lru_cache
-import pickle
-import gspread
 from unidecode import unidecode
 import pandas as pd
 from src.constants import *
+from src.google_session import get_session
 from src.utils import *
 
+def _list_file_names(drive_service, query: str):
+    """
+    List the names of all Drive files matching the query, following every result page.
+
+    Parameters:
+    drive_service (Resource): The Google Drive service object.
+    query (str): The Drive search query.
+
+    Returns:
+    List[str]: The names of all matching files.
+    """
+    names = []
+    page_token = None
+    while True:
+        request = drive_service.files().list(
+            q=query, fields="nextPageToken, files(name)", pageSize=1000, pageToken=page_token
+        )
+        results = execute_with_retry(request)
+        names.extend(file['name'] for file in results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return names
+
+
 def get_uploaded_sheets(drive_service, pdf_name : str, folder_id=None):
     """
     Retrieve the list of Google Sheets file names from Google Drive that contain the given name.
@@ -23,19 +46,31 @@ def get_uploaded_sheets(drive_service, pdf_name : str, folder_id=None):
     
     if folder_id:
         query += f" and '{folder_id}' in parents"
-    request = drive_service.files().list(q=query, fields="files(id, name)")
-    results = execute_with_retry(request)
-    files = results.get('files', [])
+    return _list_file_names(drive_service, query)
 
-    # Return a list of file names
-    return [file['name'] for file in files]
+
+def get_all_uploaded_sheets(drive_service, folder_id=None):
+    """
+    Retrieve the names of all Google Sheets in the folder with a single paginated listing.
+
+    Use this once per run instead of calling get_uploaded_sheets for every PDF.
+
+    Parameters:
+    drive_service (Resource): The Google Drive service object.
+    folder_id (str): Optional, the ID of the folder to search in. If None, searches all files.
+
+    Returns:
+    Set[str]: The names of all Google Sheets found.
+    """
+    query = "mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false"
+    if folder_id:
+        query += f" and '{folder_id}' in parents"
+    return set(_list_file_names(drive_service, query))
 
 
 @lru_cache(maxsize=None)
 def get_undertaker_data():
-    with open(TOKEN_FILE, 'rb') as token:
-        credentials = pickle.load(token)
-    gc = gspread.authorize(credentials)
+    gc = get_session().gspread_client()
     undertaker_sheet = gc.open_by_key(UNDERTAKER_SHEET_KEY)
     undertaker_worksheet = undertaker_sheet.get_worksheet_by_id(0)
     
@@ -0,0 +1,131 @@
+# upload_pool.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .memory_governor import memory_governor
+
+
+class UploadPool:
+    """
+    Run Google Drive/Sheets uploads on a pool of worker threads.
+
+    httplib2 is not thread-safe, so every worker uses its own Drive and Sheets
+    clients from the GoogleSession, on its own keep-alive connection, for its whole
+    life. Token refreshes are shared through the session.
+    """
+
+    def __init__(self, session, workers=4, queue_size=16):
+        """
+        :param session: The GoogleSession shared by all workers.
+        :param workers: The number of upload threads.
+        :param queue_size: The maximum number of queued uploads before submit() blocks.
+        """
+        self.session = session
+        self.workers = workers
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+
+        self._active = 0
+        self._busy_since = None
+        self.peak_concurrency = 0
+        self.uploaded_files = 0
+        self.uploaded_bytes = 0
+        self.busy_seconds = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args, size=0):
+        """
+        Queue fn(drive_service, sheets_service, *args) on a worker thread.
+
+        Blocks while the queue is full, or while the memory budget is used, so producers
+        can't run ahead of the uploads. The size bytes are held until the upload ends.
+
+        :param fn: The upload function to run.
+        :param size: The number of bytes uploaded by fn, used for the throughput report.
+        :return: A Future resolving to the return value of fn.
+        """
+        future = Future()
+        memory_governor.acquire(size)
+        self._queue.put((future, fn, args, size))
+        return future
+
+    def close(self):
+        """Wait for the queued uploads to finish and stop the workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _busy_time(self):
+        busy = self.busy_seconds
+        if self._busy_since is not None:
+            busy += time.time() - self._busy_since
+        return busy
+
+    def throughput(self):
+        """Return the measured upload rate in bytes per second (0 before any upload)."""
+        with self._stats_lock:
+            busy = self._busy_time()
+            return self.uploaded_bytes / busy if busy else 0
+
+    def report(self):
+        """Print the upload count, throughput and peak concurrency so far."""
+        with self._stats_lock:
+            busy = self._busy_time()
+            megabytes = self.uploaded_bytes / 1024 / 1024
+            rate = megabytes / busy if busy else 0
+            print(
+                f"Uploaded {self.uploaded_files} files ({megabytes:.1f} MB) in {busy:.1f} sec : "
+                f"{rate:.2f} MB/s, peak concurrency {self.peak_concurrency}/{self.workers}"
+            )
+
+    def _build_services(self):
+        return self.session.service("drive", "v3"), self.session.service("sheets", "v4")
+
+    def _started(self):
+        with self._stats_lock:
+            if self._active == 0:
+                self._busy_since = time.time()
+            self._active += 1
+            self.peak_concurrency = max(self.peak_concurrency, self._active)
+
+    def _finished(self, size, success):
+        with self._stats_lock:
+            self._active -= 1
+            if success:
+                self.uploaded_files += 1
+                self.uploaded_bytes += size
+            if self._active == 0:
+                self.busy_seconds += time.time() - self._busy_since
+                self._busy_since = None
+
+    def _worker(self):
+        services = None
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            future, fn, args, size = job
+            if not future.set_running_or_notify_cancel():
+                memory_governor.release(size)
+                continue
+            self._started()
+            success = False
+            try:
+                if services is None:
+                    services = self._build_services()
+                future.set_result(fn(*services, *args))
+                success = True
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._finished(size, success)
+                memory_governor.release(size)
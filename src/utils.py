@@ -1,7 +1,8 @@
 import os
 import sys
 from time import sleep
-import time
+
+from .retry import retry_call
 
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -21,21 +22,15 @@ def countdown(text: str, t: int):
         t -= 1
     print()
     
-def execute_with_retry(request, retries=10, initial_delay=1):
+def execute_with_retry(request, retries=6, initial_delay=1, wait_for_circuit=False):
     """
-    Execute a Google API request with retry logic and exponential backoff.
+    Execute a Google API request, retrying transient errors (see retry.retry_call).
     
     :param request: The API request to execute.
-    :param retries: The number of retries.
+    :param retries: The maximum number of attempts.
     :param initial_delay: Initial delay for exponential backoff.
+    :param wait_for_circuit: Wait out an open circuit and an empty retry budget instead of failing.
     :return: The response from the request if successful.
     """
-    delay = initial_delay
-    for attempt in range(retries):
-        try:
-            return request.execute()
-        except Exception as e:
-            print(f"Error {e}: Retrying in {delay} seconds...")
-            time.sleep(delay)
-            delay *= 2  # Exponential backoff
-    raise Exception(f"Max retries reached for request: {request.uri}")
\ No newline at end of file
+    endpoint = getattr(request, "methodId", None) or type(request).__name__
+    return retry_call(request.execute, endpoint, retries, initial_delay, wait_for_circuit=wait_for_circuit)